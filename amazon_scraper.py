@@ -1,41 +1,43 @@
-import requests
 import json
 import re
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from urllib.parse import urljoin, quote
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+import product_parser
+import response_cache
+from pricing import parse_price
 
 logger = logging.getLogger(__name__)
 
 class AmazonProductScraper:
+    # Amazon Best Sellers URLs by category
+    CATEGORY_URLS = {
+        "Electronics": "https://www.amazon.com/Best-Sellers-Electronics/zgbs/electronics",
+        "Books": "https://www.amazon.com/Best-Sellers-Books/zgbs/books",
+        "Home": "https://www.amazon.com/Best-Sellers-Home-Kitchen/zgbs/home-garden",
+        "Fashion": "https://www.amazon.com/Best-Sellers-Clothing-Shoes-Jewelry/zgbs/fashion",
+        "Health": "https://www.amazon.com/Best-Sellers-Health-Personal-Care/zgbs/hpc",
+        "Sports": "https://www.amazon.com/Best-Sellers-Sports-Outdoors/zgbs/sporting-goods",
+        "Tools": "https://www.amazon.com/Best-Sellers-Tools-Home-Improvement/zgbs/hi",
+        "Toys": "https://www.amazon.com/Best-Sellers-Toys-Games/zgbs/toys-and-games"
+    }
+
+    # Global cap on best-sellers fetches in flight across all callers
+    MAX_CONCURRENT_FETCHES = 8
+    _fetch_slots = threading.BoundedSemaphore(MAX_CONCURRENT_FETCHES)
+
     def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        self.headers = dict(http_client.DEFAULT_HEADERS)
     
     def extract_asin_from_affiliate_link(self, affiliate_link):
         """Extract ASIN from affiliate link like amzn.to/44TOVc2"""
         try:
-            # Follow the redirect to get the actual Amazon URL
-            response = requests.get(affiliate_link, headers=self.headers, allow_redirects=True)
-            final_url = response.url
-            
-            # Extract ASIN from the final URL
-            asin_match = re.search(r'/dp/([A-Z0-9]{10})', final_url)
-            if asin_match:
-                return asin_match.group(1)
-            
-            # Alternative pattern
-            asin_match = re.search(r'/gp/product/([A-Z0-9]{10})', final_url)
-            if asin_match:
-                return asin_match.group(1)
-                
-            return None
+            # Resolved once via HEAD redirects, then memoized in memory and the database
+            from link_resolver import resolve_asin
+            return resolve_asin(affiliate_link, headers=self.headers)
         except Exception as e:
             logger.error(f"Error extracting ASIN: {e}")
             return None
@@ -43,30 +45,19 @@ class AmazonProductScraper:
     def get_top_products_by_category(self, category="Electronics", limit=10):
         """Get top products from Amazon's best sellers in a category"""
         try:
-            # Amazon Best Sellers URLs by category
-            category_urls = {
-                "Electronics": "https://www.amazon.com/Best-Sellers-Electronics/zgbs/electronics",
-                "Books": "https://www.amazon.com/Best-Sellers-Books/zgbs/books",
-                "Home": "https://www.amazon.com/Best-Sellers-Home-Kitchen/zgbs/home-garden",
-                "Fashion": "https://www.amazon.com/Best-Sellers-Clothing-Shoes-Jewelry/zgbs/fashion",
-                "Health": "https://www.amazon.com/Best-Sellers-Health-Personal-Care/zgbs/hpc",
-                "Sports": "https://www.amazon.com/Best-Sellers-Sports-Outdoors/zgbs/sporting-goods",
-                "Tools": "https://www.amazon.com/Best-Sellers-Tools-Home-Improvement/zgbs/hi",
-                "Toys": "https://www.amazon.com/Best-Sellers-Toys-Games/zgbs/toys-and-games"
-            }
-            
-            url = category_urls.get(category, category_urls["Electronics"])
+            url = self.CATEGORY_URLS.get(category, self.CATEGORY_URLS["Electronics"])
             
-            response = requests.get(url, headers=self.headers)
+            response = response_cache.cached_get(url, headers=self.headers)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
             products = []
             
             # Find product containers in best sellers page
-            product_containers = soup.find_all('div', {'class': re.compile('zg-grid-general-faceout')})
+            product_containers = product_parser.find_bestseller_containers(
+                response.content, limit, encoding=http_client.header_charset(response.headers)
+            )
             
-            for container in product_containers[:limit]:
+            for container in product_containers:
                 try:
                     product = self.extract_product_info(container)
                     if product:
@@ -81,6 +72,35 @@ class AmazonProductScraper:
             logger.error(f"Error getting top products: {e}")
             return []
     
+    def get_top_products_for_categories(self, categories=None, limit=10):
+        """Get top products for several categories concurrently
+
+        Returns a dict of category -> products. A category that fails to
+        load maps to an empty list so the other categories still come back.
+        """
+        if categories is None:
+            categories = list(self.CATEGORY_URLS)
+        categories = list(dict.fromkeys(categories))
+        if not categories:
+            return {}
+        
+        def fetch(category):
+            with self._fetch_slots:
+                return self.get_top_products_by_category(category, limit)
+        
+        results = {}
+        workers = min(len(categories), self.MAX_CONCURRENT_FETCHES)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {category: executor.submit(fetch, category) for category in categories}
+            for category, future in futures.items():
+                try:
+                    results[category] = future.result()
+                except Exception as e:
+                    logger.error(f"Error getting top products for {category}: {e}")
+                    results[category] = []
+        
+        return results
+    
     def extract_product_info(self, container):
         """Extract product information from container"""
         try:
@@ -112,6 +132,7 @@ class AmazonProductScraper:
             if not price_elem:
                 price_elem = container.find('span', class_='a-price-whole')
             price = price_elem.get_text(strip=True) if price_elem else "Price not available"
+            price_cents, currency = parse_price(price)
             
             # Rating
             rating_elem = container.find('span', class_='a-icon-alt')
@@ -128,6 +149,8 @@ class AmazonProductScraper:
                 'url': product_url,
                 'image': image_url,
                 'price': price,
+                'price_cents': price_cents,
+                'currency': currency,
                 'rating': rating,
                 'description': f"Top-rated {title} from Amazon's best sellers"
             }
@@ -156,10 +179,12 @@ class AmazonProductScraper:
     def get_trending_products(self, limit=10):
         """Get trending products from Amazon's main page"""
         try:
-            response = requests.get("https://www.amazon.com", headers=self.headers)
+            response = response_cache.cached_get("https://www.amazon.com", headers=self.headers)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Only build the product links (and their children) from the homepage
+            product_links_only = SoupStrainer('a', href=re.compile(r'/dp/[A-Z0-9]{10}'))
+            soup = BeautifulSoup(response.content, 'lxml', parse_only=product_links_only)
             products = []
             
             # Look for product cards on homepage
@@ -2,56 +2,100 @@
 Amazon Product Search System
 Search and retrieve products directly from Amazon
 """
-import requests
-from bs4 import BeautifulSoup
 import re
-import time
-import random
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote_plus
-from models import ProductInventory
 from app import db
+import http_client
+import product_parser
+import response_cache
+from pricing import parse_price
+
+# Amazon stops serving results after about 20 pages
+MAX_SEARCH_PAGES = 20
+# Used to decide whether the next page is worth prefetching before we've seen one
+RESULTS_PER_PAGE_ESTIMATE = 16
+# Products written to the inventory per commit when streaming a search
+INSERT_BATCH_SIZE = 50
 
 
 class AmazonSearcher:
     def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        self.headers = dict(http_client.DEFAULT_HEADERS)
     
     def search_products(self, query, limit=20):
         """Search Amazon for products based on query"""
         try:
-            # Format search URL
-            search_url = f"https://www.amazon.com/s?k={quote_plus(query)}&ref=sr_pg_1"
-            
-            # Add random delay to avoid rate limiting
-            time.sleep(random.uniform(1, 3))
-            
-            response = requests.get(search_url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find product containers
-            products = []
-            product_containers = soup.find_all('div', {'data-component-type': 's-search-result'})
-            
-            for container in product_containers[:limit]:
-                product_data = self._extract_product_data(container)
-                if product_data and product_data.get('asin'):
-                    products.append(product_data)
-            
-            return products
-            
+            return list(self.iter_search_results(query, limit))
         except Exception as e:
             print(f"Error searching Amazon: {e}")
             return []
     
+    def iter_search_results(self, query, max_results=20, max_pages=MAX_SEARCH_PAGES):
+        """Yield search results across result pages as they are parsed
+
+        The next page is fetched in the background while the current one is
+        being parsed, so a multi-page search costs about one fetch per page
+        of wall time instead of fetch plus parse.
+        """
+        if max_results <= 0:
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            page = 1
+            pending = executor.submit(self._fetch_search_page, query, page)
+            yielded = 0
+            last_page_count = RESULTS_PER_PAGE_ESTIMATE
+            seen_asins = set()
+            
+            while pending is not None:
+                try:
+                    response = pending.result()
+                except Exception as e:
+                    print(f"Error fetching search page {page} for {query}: {e}")
+                    return
+                
+                # Prefetch the next page only if this one probably won't be enough
+                pending = None
+                if page < max_pages and max_results - yielded > last_page_count:
+                    pending = executor.submit(self._fetch_search_page, query, page + 1)
+                
+                page_count = 0
+                for container in product_parser.iter_product_containers(
+                    response.content,
+                    product_parser.is_search_result_container,
+                    encoding=http_client.header_charset(response.headers)
+                ):
+                    product_data = self._extract_product_data(container)
+                    if not product_data or not product_data.get('asin'):
+                        continue
+                    if product_data['asin'] in seen_asins:
+                        continue
+                    seen_asins.add(product_data['asin'])
+                    page_count += 1
+                    yielded += 1
+                    yield product_data
+                    if yielded >= max_results:
+                        return
+                
+                if page_count == 0:
+                    return
+                last_page_count = page_count
+                
+                if pending is None and page < max_pages:
+                    pending = executor.submit(self._fetch_search_page, query, page + 1)
+                page += 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _fetch_search_page(self, query, page):
+        """Fetch one page of search results"""
+        search_url = f"https://www.amazon.com/s?k={quote_plus(query)}&page={page}&ref=sr_pg_{page}"
+        response = response_cache.cached_get(search_url, headers=self.headers)
+        response.raise_for_status()
+        return response
+    
     def _extract_product_data(self, container):
         """Extract product information from search result container"""
         try:
@@ -76,6 +120,7 @@ class AmazonSearcher:
                 price_elem = price_container.find('span', class_='a-offscreen')
                 if price_elem:
                     product['price'] = price_elem.get_text(strip=True)
+                    product['price_cents'], product['currency'] = parse_price(product['price'])
             
             # Extract rating
             rating_elem = container.find('span', class_='a-icon-alt')
@@ -101,35 +146,11 @@ class AmazonSearcher:
     
     def add_search_results_to_inventory(self, products):
         """Add search results to product inventory"""
-        added_count = 0
-        
-        for product_data in products:
-            try:
-                # Check if product already exists
-                existing = ProductInventory.query.filter_by(asin=product_data['asin']).first()
-                
-                if not existing:
-                    # Create new product
-                    new_product = ProductInventory(
-                        asin=product_data['asin'],
-                        product_title=product_data.get('title', 'Unknown Product'),
-                        category=product_data.get('category', 'Electronics'),
-                        price=product_data.get('price', ''),
-                        rating=product_data.get('rating', 0.0),
-                        image_url=product_data.get('image_url', ''),
-                        is_active=True,
-                        is_trending=False
-                    )
-                    db.session.add(new_product)
-                    added_count += 1
-                
-            except Exception as e:
-                print(f"Error adding product to inventory: {e}")
-                continue
+        from inventory_manager import InventoryManager
         
         try:
-            db.session.commit()
-            return added_count
+            counts = InventoryManager().add_products_to_inventory(products)
+            return counts['inserted']
         except Exception as e:
             print(f"Error committing to database: {e}")
             db.session.rollback()
@@ -149,22 +170,29 @@ class AmazonSearcher:
         """Search for products and automatically add them to inventory"""
         print(f"Searching Amazon for: {query}")
         
-        # Search for products
-        search_results = self.search_products(query, limit)
+        # Stream results into the inventory a batch at a time
+        total_found = 0
+        added_count = 0
+        batch = []
+        for product_data in self.iter_search_results(query, limit):
+            batch.append(product_data)
+            total_found += 1
+            if len(batch) >= INSERT_BATCH_SIZE:
+                added_count += self.add_search_results_to_inventory(batch)
+                batch = []
+        if batch:
+            added_count += self.add_search_results_to_inventory(batch)
         
-        if not search_results:
+        if not total_found:
             return {
                 'success': False,
                 'message': f'No products found for "{query}"',
                 'products_added': 0
             }
         
-        # Add to inventory
-        added_count = self.add_search_results_to_inventory(search_results)
-        
         return {
             'success': True,
-            'message': f'Found {len(search_results)} products, added {added_count} new ones',
+            'message': f'Found {total_found} products, added {added_count} new ones',
             'products_added': added_count,
-            'total_found': len(search_results)
-        }
\ No newline at end of file
+            'total_found': total_found
+        }
@@ -1,59 +1,98 @@
 """
 Analytics Dashboard - Track campaign performance and revenue
 """
-from datetime import datetime, timedelta
-from sqlalchemy import func
+from datetime import date, datetime, timedelta
+from sqlalchemy import DateTime, case, cast, func
 from app import db
-from models import Post, User, Campaign, ProductInventory
+from models import ClickDailyStat, ClickEvent, Post, PostDailyStat, User, Campaign, ProductInventory
+from rollups import ALL_PLATFORMS, PLATFORM_FLAGS
+from click_events import hour_of_day
+from click_filter import NOT_COUNTED
+
+STATS_GRANULARITIES = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+
+def _truncate(moment, granularity):
+    """Start of the hour/day/week containing moment, like date_trunc"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def _bucket_expression(column, granularity):
+    """SQL for the start of the bucket a timestamp or date falls in
+
+    Always a naive timestamp (or an ISO string on SQLite): date_trunc on a
+    date column picks the timestamptz overload, whose values never equal the
+    naive bucket starts they are looked up by.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        if granularity == 'hour':
+            return func.strftime('%Y-%m-%d %H:00:00', column)
+        if granularity == 'week':
+            # Forward to Sunday (or stay), then back to that week's Monday
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.date(column)
+    return cast(func.date_trunc(granularity, column), DateTime)
 
 
 class AnalyticsDashboard:
     def __init__(self, user=None):
         self.user = user
     
-    def get_user_analytics(self, days=30):
-        """Get comprehensive analytics for user"""
+    def get_user_analytics(self, days=30, granularity='day'):
+        """Get comprehensive analytics for user
+        
+        granularity sets the daily_stats bucket size: 'hour', 'day' or 'week'.
+        """
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Get user's posts in date range
-        posts = Post.query.filter(
-            Post.user_id == self.user.id,
-            Post.created_at >= start_date
-        ).all()
+        # The rollup is per day, so the window starts at midnight
+        start_date = _truncate(start_date, 'day')
         
-        total_posts = len(posts)
-        total_clicks = sum(post.clicks for post in posts)
-        total_impressions = sum(post.impressions for post in posts)
-        estimated_revenue = sum(post.revenue_estimated for post in posts)
+        # Totals and platform breakdown from the daily rollup, in one query
+        rows = db.session.query(
+            PostDailyStat.platform,
+            func.sum(PostDailyStat.posts),
+            func.sum(PostDailyStat.clicks),
+            func.sum(PostDailyStat.impressions),
+            func.sum(PostDailyStat.revenue),
+            func.sum(PostDailyStat.conversion_rate_sum)
+        ).filter(
+            PostDailyStat.user_id == self.user.id,
+            PostDailyStat.day >= start_date.date()
+        ).group_by(PostDailyStat.platform).all()
+        by_platform = {row[0]: row[1:] for row in rows}
+        
+        total_posts, total_clicks, total_impressions, estimated_revenue, conversion_sum = by_platform.get(
+            ALL_PLATFORMS, (0, 0, 0, 0.0, 0.0)
+        )
         
         # Platform breakdown
         platform_stats = {
-            'discord': {'posts': 0, 'clicks': 0},
-            'telegram': {'posts': 0, 'clicks': 0},
-            'slack': {'posts': 0, 'clicks': 0},
-            'email': {'posts': 0, 'clicks': 0}
+            platform: {
+                'posts': by_platform[platform][0] if platform in by_platform else 0,
+                'clicks': by_platform[platform][1] if platform in by_platform else 0
+            }
+            for platform in PLATFORM_FLAGS
         }
         
-        for post in posts:
-            if post.posted_to_discord:
-                platform_stats['discord']['posts'] += 1
-                platform_stats['discord']['clicks'] += post.clicks
-            if post.posted_to_telegram:
-                platform_stats['telegram']['posts'] += 1
-                platform_stats['telegram']['clicks'] += post.clicks
-            if post.posted_to_slack:
-                platform_stats['slack']['posts'] += 1
-                platform_stats['slack']['clicks'] += post.clicks
-            if post.posted_to_email:
-                platform_stats['email']['posts'] += 1
-                platform_stats['email']['clicks'] += post.clicks
-        
         # Top performing products
-        top_products = sorted(posts, key=lambda x: x.clicks, reverse=True)[:5]
+        top_products = Post.query.filter(
+            Post.user_id == self.user.id,
+            Post.created_at >= start_date
+        ).order_by(Post.clicks.desc()).limit(5).all()
         
         # Daily stats for chart
-        daily_stats = self._get_daily_stats(start_date, end_date)
+        daily_stats = self._get_daily_stats(start_date, end_date, granularity)
         
         return {
             'total_posts': total_posts,
@@ -65,7 +104,7 @@ class AnalyticsDashboard:
             'platform_stats': platform_stats,
             'top_products': top_products,
             'daily_stats': daily_stats,
-            'conversion_rate': sum(post.conversion_rate for post in posts) / total_posts if total_posts > 0 else 0
+            'conversion_rate': conversion_sum / total_posts if total_posts > 0 else 0
         }
     
     def get_admin_analytics(self):
@@ -78,10 +117,15 @@ class AnalyticsDashboard:
         
         # Total posts last 30 days
         thirty_days_ago = datetime.now() - timedelta(days=30)
-        recent_posts = Post.query.filter(Post.created_at >= thirty_days_ago).count()
+        recent_posts = db.session.query(func.sum(PostDailyStat.posts)).filter(
+            PostDailyStat.platform == ALL_PLATFORMS,
+            PostDailyStat.day >= thirty_days_ago.date()
+        ).scalar() or 0
         
         # Total revenue estimate
-        total_revenue = db.session.query(func.sum(Post.revenue_estimated)).scalar() or 0
+        total_revenue = db.session.query(func.sum(PostDailyStat.revenue)).filter(
+            PostDailyStat.platform == ALL_PLATFORMS
+        ).scalar() or 0
         
         # Most popular products
         popular_products = db.session.query(
@@ -91,12 +135,11 @@ class AnalyticsDashboard:
         ).order_by(ProductInventory.times_promoted.desc()).limit(10).all()
         
         # Platform usage
-        platform_usage = {
-            'discord': Post.query.filter(Post.posted_to_discord == True).count(),
-            'telegram': Post.query.filter(Post.posted_to_telegram == True).count(),
-            'slack': Post.query.filter(Post.posted_to_slack == True).count(),
-            'email': Post.query.filter(Post.posted_to_email == True).count()
-        }
+        platform_posts = dict(db.session.query(
+            PostDailyStat.platform,
+            func.sum(PostDailyStat.posts)
+        ).filter(PostDailyStat.platform != ALL_PLATFORMS).group_by(PostDailyStat.platform).all())
+        platform_usage = {platform: platform_posts.get(platform, 0) for platform in PLATFORM_FLAGS}
         
         # Growth metrics
         total_users = User.query.count()
@@ -113,66 +156,155 @@ class AnalyticsDashboard:
             'growth_rate': (new_users_30d / total_users * 100) if total_users > 0 else 0
         }
     
-    def _get_daily_stats(self, start_date, end_date):
-        """Get daily statistics for charts"""
-        daily_stats = []
-        current_date = start_date
+    def _get_daily_stats(self, start_date, end_date, granularity='day'):
+        """Get daily statistics for charts
+        
+        granularity is 'hour', 'day' or 'week' (weeks start on Monday). One
+        GROUP BY query covers the window, over post_daily_stats for days and
+        weeks; empty buckets are filled with zeros.
+        """
+        step = STATS_GRANULARITIES[granularity]
+        first_bucket = _truncate(start_date, granularity)
+        last_bucket = _truncate(end_date, granularity)
         
-        while current_date <= end_date:
-            next_date = current_date + timedelta(days=1)
-            
-            day_posts = Post.query.filter(
+        if granularity == 'hour':
+            # Finer than the rollup, so count the posts themselves
+            bucket = _bucket_expression(Post.created_at, granularity)
+            rows = db.session.query(
+                bucket,
+                func.count(Post.id),
+                func.coalesce(func.sum(Post.clicks), 0),
+                func.coalesce(func.sum(Post.revenue_estimated), 0.0)
+            ).filter(
                 Post.user_id == self.user.id,
-                Post.created_at >= current_date,
-                Post.created_at < next_date
-            ).all()
-            
+                Post.created_at >= start_date,
+                Post.created_at < last_bucket + step
+            ).group_by(bucket).all()
+        else:
+            bucket = _bucket_expression(PostDailyStat.day, granularity)
+            rows = db.session.query(
+                bucket,
+                func.sum(PostDailyStat.posts),
+                func.sum(PostDailyStat.clicks),
+                func.sum(PostDailyStat.revenue)
+            ).filter(
+                PostDailyStat.user_id == self.user.id,
+                PostDailyStat.platform == ALL_PLATFORMS,
+                PostDailyStat.day >= start_date.date(),
+                PostDailyStat.day < (last_bucket + step).date()
+            ).group_by(bucket).all()
+        
+        totals = {}
+        for bucket_start, posts, clicks, revenue in rows:
+            if isinstance(bucket_start, str):
+                bucket_start = datetime.fromisoformat(bucket_start)
+            elif not isinstance(bucket_start, datetime) and isinstance(bucket_start, date):
+                bucket_start = datetime.combine(bucket_start, datetime.min.time())
+            totals[bucket_start] = (posts, clicks, revenue)
+        
+        label_format = '%Y-%m-%d %H:00' if granularity == 'hour' else '%Y-%m-%d'
+        daily_stats = []
+        current = first_bucket
+        while current <= last_bucket:
+            posts, clicks, revenue = totals.get(current, (0, 0, 0))
             daily_stats.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'posts': len(day_posts),
-                'clicks': sum(post.clicks for post in day_posts),
-                'revenue': sum(post.revenue_estimated for post in day_posts)
+                'date': current.strftime(label_format),
+                'posts': posts,
+                'clicks': clicks,
+                'revenue': revenue
             })
-            
-            current_date = next_date
+            current += step
         
         return daily_stats
     
-    def get_product_performance(self, limit=20):
-        """Get top performing products for user"""
+    def get_click_breakdown(self, days=30):
+        """Clicks by hour of day, traffic source and client class
+        
+        Combines raw click_events with click_daily_stats for the part of the
+        window that has already been rolled up. Sources are referrer hashes.
+        Unfurl and bot hits are logged but not counted as clicks, so they
+        only appear in by_client.
+        """
+        start_date = _truncate(datetime.now() - timedelta(days=days), 'day')
+        by_hour = [0] * 24
+        by_source = {}
+        by_client = {}
+        
+        def add(hour, source, client, clicks):
+            by_client[client] = by_client.get(client, 0) + clicks
+            if client in NOT_COUNTED:
+                return
+            by_hour[hour] += clicks
+            by_source[source or 'direct'] = by_source.get(source or 'direct', 0) + clicks
+        
+        rolled_up = db.session.query(
+            ClickDailyStat.hour,
+            ClickDailyStat.referrer_hash,
+            ClickDailyStat.ua_class,
+            func.sum(ClickDailyStat.clicks)
+        ).filter(
+            ClickDailyStat.user_id == self.user.id,
+            ClickDailyStat.day >= start_date.date()
+        ).group_by(ClickDailyStat.hour, ClickDailyStat.referrer_hash, ClickDailyStat.ua_class)
+        for hour, source, client, clicks in rolled_up:
+            add(hour, source, client, clicks)
+        
+        hour = hour_of_day(ClickEvent.ts)
+        recent = db.session.query(
+            hour,
+            ClickEvent.referrer_hash,
+            ClickEvent.ua_class,
+            func.count(ClickEvent.id)
+        ).join(Post, Post.id == ClickEvent.post_id).filter(
+            Post.user_id == self.user.id,
+            ClickEvent.ts >= start_date
+        ).group_by(hour, ClickEvent.referrer_hash, ClickEvent.ua_class)
+        for hour, source, client, clicks in recent:
+            add(int(hour), source, client, clicks)
+        
+        return {'by_hour': by_hour, 'by_source': by_source, 'by_client': by_client}
+    
+    def get_product_performance(self, limit=20, start_date=None, end_date=None, category=None):
+        """Get top performing products for user
+        
+        Posts are grouped by ASIN (or title, for posts without one) in SQL,
+        optionally limited to posts created in [start_date, end_date) and to
+        one category. Returns [(asin, stats)] ordered by revenue.
+        """
         if not self.user:
             return []
         
-        posts = Post.query.filter(Post.user_id == self.user.id).all()
-        
-        # Group by ASIN and aggregate stats
-        product_stats = {}
-        for post in posts:
-            asin = post.asin or post.product_title
-            if asin not in product_stats:
-                product_stats[asin] = {
-                    'title': post.product_title,
-                    'posts': 0,
-                    'clicks': 0,
-                    'revenue': 0,
-                    'conversion_rate': 0,
-                    'category': post.category
-                }
-            
-            product_stats[asin]['posts'] += 1
-            product_stats[asin]['clicks'] += post.clicks
-            product_stats[asin]['revenue'] += post.revenue_estimated
-        
-        # Calculate conversion rates
-        for asin, stats in product_stats.items():
-            if stats['clicks'] > 0:
-                stats['conversion_rate'] = (stats['revenue'] / stats['clicks']) * 100
-        
-        # Sort by revenue and return top performers
-        sorted_products = sorted(
-            product_stats.items(),
-            key=lambda x: x[1]['revenue'],
-            reverse=True
-        )
+        product_key = func.coalesce(Post.asin, Post.product_title)
+        clicks = func.coalesce(func.sum(Post.clicks), 0)
+        revenue = func.coalesce(func.sum(Post.revenue_estimated), 0.0)
         
-        return sorted_products[:limit]
\ No newline at end of file
+        query = db.session.query(
+            product_key,
+            func.max(Post.product_title),
+            func.count(Post.id),
+            clicks,
+            revenue,
+            case((clicks > 0, revenue / clicks * 100), else_=0),
+            func.max(Post.category)
+        ).filter(Post.user_id == self.user.id)
+        
+        if start_date is not None:
+            query = query.filter(Post.created_at >= start_date)
+        if end_date is not None:
+            query = query.filter(Post.created_at < end_date)
+        if category:
+            query = query.filter(Post.category == category)
+        
+        rows = query.group_by(product_key).order_by(revenue.desc()).limit(limit).all()
+        
+        return [
+            (asin, {
+                'title': title,
+                'posts': posts,
+                'clicks': total_clicks,
+                'revenue': total_revenue,
+                'conversion_rate': conversion_rate,
+                'category': product_category
+            })
+            for asin, title, posts, total_clicks, total_revenue, conversion_rate, product_category in rows
+        ]
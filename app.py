@@ -26,8 +26,25 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 
 db = SQLAlchemy(app, model_class=Base)
 
+# Bulk writes (inventory, counters, rollups) use INSERT ... ON CONFLICT as
+# PostgreSQL and SQLite spell it; fail here rather than on the first write
+SUPPORTED_DATABASES = ('postgresql', 'sqlite')
+
 # Create tables
 with app.app_context():
+    if db.engine.dialect.name not in SUPPORTED_DATABASES:
+        raise RuntimeError(
+            f"Unsupported database {db.engine.dialect.name!r}: DATABASE_URL must be "
+            f"one of {', '.join(SUPPORTED_DATABASES)}"
+        )
+
     import models
     db.create_all()
-    logging.info("Database tables created")
\ No newline at end of file
+    logging.info("Database tables created")
+
+    from migrations import run_migrations
+    run_migrations()
+
+# Click redirects are answered before Flask's session and login handling
+from click_redirect import ClickRedirectMiddleware
+app.wsgi_app = ClickRedirectMiddleware(app.wsgi_app)
\ No newline at end of file
@@ -4,10 +4,15 @@ Automatically picks and promotes top-performing products
 """
 from datetime import datetime, timedelta
 import random
+from sqlalchemy import func, select
 from app import db
 from models import ProductInventory, Post, User
-from inventory_manager import InventoryManager
+from inventory_manager import InventoryManager, not_promoted_since
 from webhook_manager import WebhookManager
+import counters
+from scoring import calculate_ai_score
+
+DEFAULT_RECOMMENDATION_CATEGORIES = ['Electronics', 'Gaming', 'Smart Home', 'Kitchen', 'Outdoor']
 
 
 class AutoProductSelector:
@@ -16,8 +21,13 @@ class AutoProductSelector:
         self.inventory = InventoryManager()
         self.webhook_manager = WebhookManager(user)
     
-    def get_ai_recommended_products(self, category=None, limit=10):
-        """AI algorithm to select best products for promotion"""
+    def get_ai_recommended_products(self, category=None, limit=10, min_price_cents=None, max_price_cents=None,
+                                    exclude_promoted_since=None):
+        """AI algorithm to select best products for promotion
+        
+        exclude_promoted_since leaves out products this user has posted
+        since that time.
+        """
         
         # Get all available products
         query = ProductInventory.query.filter(ProductInventory.is_active == True)
@@ -25,65 +35,32 @@ class AutoProductSelector:
         if category:
             query = query.filter(ProductInventory.category == category)
         
-        all_products = query.all()
+        # Optional price band, served by the (is_active, price_cents) index
+        if min_price_cents is not None:
+            query = query.filter(ProductInventory.price_cents >= min_price_cents)
+        if max_price_cents is not None:
+            query = query.filter(ProductInventory.price_cents <= max_price_cents)
         
-        # AI scoring algorithm
-        scored_products = []
-        for product in all_products:
-            score = self._calculate_ai_score(product)
-            scored_products.append((product, score))
+        if exclude_promoted_since is not None:
+            query = query.filter(not_promoted_since(self.user.id, exclude_promoted_since))
+        
+        # Scores are precomputed and indexed, so this reads only `limit` rows
+        return query.order_by(ProductInventory.ai_score.desc()).limit(limit).all()
+    
+    def rank_inventory(self, category=None, limit=10, category_bonus=None):
+        """Re-score the active inventory in one batch and return [(asin, score)]
         
-        # Sort by AI score (highest first)
-        scored_products.sort(key=lambda x: x[1], reverse=True)
+        Scores are computed fresh rather than read from ai_score, so
+        category_bonus can be changed to see how the ranking would move.
+        """
+        from batch_scoring import InventoryScores
         
-        # Return top products
-        return [product for product, score in scored_products[:limit]]
+        criteria = [ProductInventory.category == category] if category else []
+        return InventoryScores.load(*criteria).ranked(limit, category_bonus)
     
     def _calculate_ai_score(self, product):
         """AI scoring algorithm considering multiple factors"""
-        score = 0
-        
-        # Rating factor (0-50 points)
-        if product.rating:
-            score += (product.rating / 5.0) * 50
-        
-        # Price range factor (prefer $20-$300 range)
-        if product.price:
-            try:
-                price_num = float(product.price.replace('$', '').replace(',', ''))
-                if 20 <= price_num <= 300:
-                    score += 30  # Sweet spot for conversions
-                elif price_num < 20:
-                    score += 15  # Too cheap, lower commissions
-                else:
-                    score += 20  # Expensive, good commissions but harder to sell
-            except:
-                score += 10  # Default if price parsing fails
-        
-        # Promotion frequency (avoid over-promoted products)
-        times_promoted = product.times_promoted or 0
-        if times_promoted < 5:
-            score += 25  # Fresh products get bonus
-        elif times_promoted < 15:
-            score += 15  # Moderately promoted
-        else:
-            score += 5   # Over-promoted products get penalty
-        
-        # Conversion rate factor
-        if product.conversion_rate:
-            score += product.conversion_rate * 20
-        
-        # Trending bonus
-        if product.is_trending:
-            score += 20
-        
-        # Category preferences (Electronics tend to convert well)
-        if product.category == 'Electronics':
-            score += 15
-        elif product.category in ['Gaming', 'Smart Home']:
-            score += 10
-        
-        return score
+        return calculate_ai_score(product)
     
     def auto_promote_products(self, num_products=3):
         """Automatically select and promote top products"""
@@ -98,27 +75,18 @@ class AutoProductSelector:
         if not SubscriptionManager.can_user_post(self.user):
             return {'success': False, 'error': 'Posting frequency limit reached'}
         
-        # Get AI-recommended products
-        recommended_products = self.get_ai_recommended_products(limit=num_products * 2)
-        
-        # Filter out recently promoted products by this user
-        recent_posts = Post.query.filter(
-            Post.user_id == self.user.id,
-            Post.created_at >= datetime.now() - timedelta(hours=24)
-        ).all()
-        
-        recent_asins = [post.asin for post in recent_posts if post.asin]
-        
-        available_products = [
-            p for p in recommended_products 
-            if p.asin not in recent_asins
-        ][:num_products]
+        # Get AI-recommended products this user hasn't promoted in 24 hours
+        available_products = self.get_ai_recommended_products(
+            limit=num_products,
+            exclude_promoted_since=datetime.now() - timedelta(hours=24)
+        )
         
         if not available_products:
             return {'success': False, 'error': 'No suitable products available'}
         
         # Promote selected products
         promoted_products = []
+        promoted_asins = []
         total_platforms = 0
         
         for product in available_products:
@@ -158,8 +126,7 @@ class AutoProductSelector:
                 )
                 db.session.add(new_post)
                 
-                # Update product stats
-                self.inventory.mark_product_promoted(product.asin, self.user.id)
+                promoted_asins.append(product.asin)
                 
                 promoted_products.append({
                     'title': product.product_title,
@@ -168,6 +135,8 @@ class AutoProductSelector:
                 })
                 total_platforms += platforms_posted
         
+        # Record every promotion in one UPDATE, committed with the new posts
+        counters.increment_product_promotions(promoted_asins, commit=False)
         db.session.commit()
         
         return {
@@ -177,13 +146,33 @@ class AutoProductSelector:
             'products': promoted_products
         }
     
-    def get_category_recommendations(self):
+    def get_category_recommendations(self, categories=None, limit=3):
         """Get AI recommendations by category"""
-        categories = ['Electronics', 'Gaming', 'Smart Home', 'Kitchen', 'Outdoor']
-        recommendations = {}
-        
-        for category in categories:
-            products = self.get_ai_recommended_products(category=category, limit=3)
-            recommendations[category] = products
+        if categories is None:
+            categories = DEFAULT_RECOMMENDATION_CATEGORIES
+        recommendations = {category: [] for category in categories}
+        if not recommendations:
+            return recommendations
+        
+        # One query ranks every category at once instead of one query each
+        rank = func.row_number().over(
+            partition_by=ProductInventory.category,
+            order_by=(ProductInventory.ai_score.desc(), ProductInventory.id)
+        ).label('category_rank')
+        ranked = (
+            select(ProductInventory.id, rank)
+            .where(ProductInventory.is_active == True, ProductInventory.category.in_(recommendations))
+            .subquery()
+        )
+        products = (
+            ProductInventory.query
+            .join(ranked, ranked.c.id == ProductInventory.id)
+            .filter(ranked.c.category_rank <= limit)
+            .order_by(ProductInventory.category, ranked.c.category_rank)
+            .all()
+        )
+        
+        for product in products:
+            recommendations[product.category].append(product)
         
         return recommendations
\ No newline at end of file
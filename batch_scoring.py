@@ -0,0 +1,142 @@
+"""
+Batch AI Scoring - Score the whole inventory at once with NumPy
+Loads only the scoring columns into arrays and evaluates the same formula as
+scoring.calculate_ai_score term by term, for ad-hoc re-ranking and trying out
+different category bonuses without touching the stored ai_score
+"""
+import numpy as np
+from sqlalchemy import func, select
+
+from scoring import CATEGORY_BONUS
+
+
+class InventoryScores:
+    """Scoring columns for a set of products, one NumPy array per column"""
+
+    def __init__(self, asins, rating, has_price, price_cents, times_promoted,
+                 conversion_rate, is_trending, category):
+        self.asins = np.asarray(asins, dtype=object)
+        # NaN stands in for NULL in the numeric columns
+        self.rating = np.asarray(rating, dtype=np.float64)
+        self.has_price = np.asarray(has_price, dtype=bool)
+        self.price_cents = np.asarray(price_cents, dtype=np.float64)
+        self.times_promoted = np.asarray(times_promoted, dtype=np.int64)
+        self.conversion_rate = np.asarray(conversion_rate, dtype=np.float64)
+        self.is_trending = np.asarray(is_trending, dtype=bool)
+        self.category = np.asarray(category, dtype=object)
+
+    def __len__(self):
+        return len(self.asins)
+
+    @classmethod
+    def from_products(cls, products):
+        """Build from ORM objects or anything with the scoring attributes"""
+        products = list(products)
+
+        def column(name, default):
+            value = (getattr(p, name) for p in products)
+            return [default if v is None else v for v in value]
+
+        return cls(
+            asins=[p.asin for p in products],
+            rating=column('rating', np.nan),
+            has_price=[bool(p.price) for p in products],
+            price_cents=column('price_cents', np.nan),
+            times_promoted=column('times_promoted', 0),
+            conversion_rate=column('conversion_rate', np.nan),
+            is_trending=[bool(p.is_trending) for p in products],
+            category=column('category', ''),
+        )
+
+    @classmethod
+    def load(cls, *criteria):
+        """Load the active inventory (optionally filtered) in one SELECT"""
+        from app import db
+        from models import ProductInventory
+
+        rows = db.session.execute(
+            select(
+                ProductInventory.asin,
+                ProductInventory.rating,
+                func.coalesce(ProductInventory.price, '') != '',
+                ProductInventory.price_cents,
+                func.coalesce(ProductInventory.times_promoted, 0),
+                ProductInventory.conversion_rate,
+                func.coalesce(ProductInventory.is_trending, False),
+                func.coalesce(ProductInventory.category, ''),
+            )
+            .where(ProductInventory.is_active == True, *criteria)
+            .order_by(ProductInventory.id)
+        ).all()
+        if not rows:
+            return cls([], [], [], [], [], [], [], [])
+
+        asins, rating, has_price, price_cents, times_promoted, conversion_rate, is_trending, category = zip(*rows)
+        to_float = lambda values: [np.nan if v is None else v for v in values]
+        return cls(asins, to_float(rating), has_price, to_float(price_cents), times_promoted,
+                   to_float(conversion_rate), is_trending, category)
+
+    def scores(self, category_bonus=None):
+        """AI score for every product, identical to scoring.calculate_ai_score
+
+        Terms are added in the scalar scorer's order so float results match
+        exactly. Pass category_bonus to try different category weights.
+        """
+        category_bonus = CATEGORY_BONUS if category_bonus is None else category_bonus
+        score = np.zeros(len(self), dtype=np.float64)
+
+        # Rating factor (0-50 points); NULL and 0 both score nothing
+        rating = np.nan_to_num(self.rating, nan=0.0)
+        score += np.where(rating != 0, rating / 5.0 * 50, 0.0)
+
+        # Price range factor (prefer $20-$300 range)
+        cents = self.price_cents
+        price = np.select(
+            [np.isnan(cents), (cents >= 2000) & (cents <= 30000), cents < 2000],
+            [10, 30, 15],
+            default=20,
+        )
+        score += np.where(self.has_price, price, 0)
+
+        # Promotion frequency (avoid over-promoted products)
+        score += np.select([self.times_promoted < 5, self.times_promoted < 15], [25, 15], default=5)
+
+        # Conversion rate factor
+        conversion = np.nan_to_num(self.conversion_rate, nan=0.0)
+        score += np.where(conversion != 0, conversion * 20, 0.0)
+
+        # Trending bonus
+        score += np.where(self.is_trending, 20, 0)
+
+        # Category preferences; one comparison pass per bonus category is far
+        # cheaper than sorting the object array to find distinct categories
+        bonus = np.zeros(len(self), dtype=np.float64)
+        for name, points in category_bonus.items():
+            bonus[self.category == name] = points
+        score += bonus
+
+        return score
+
+    def top_k(self, k, scores=None):
+        """Indexes of the k best products, best first
+
+        argpartition finds the k best in linear time; only those are sorted.
+        Ties keep inventory order, like a stable sort of the scalar scores.
+        """
+        scores = self.scores() if scores is None else scores
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.array([], dtype=np.int64)
+        if k < len(scores):
+            threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            above = np.flatnonzero(scores > threshold)
+            tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+            candidates = np.concatenate([above, tied])
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+    def ranked(self, k, category_bonus=None):
+        """[(asin, score)] for the k best products, best first"""
+        scores = self.scores(category_bonus)
+        return [(self.asins[i], float(scores[i])) for i in self.top_k(k, scores)]
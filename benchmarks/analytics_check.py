@@ -0,0 +1,100 @@
+"""
+Analytics Check - Compare the SQL chart buckets with totals computed in Python
+
+Usage:
+    python benchmarks/analytics_check.py [--posts N] [--database-url URL]
+
+Without --database-url a throwaway SQLite file is used; run it against a
+scratch PostgreSQL database too, since bucketing is dialect specific there.
+Exits non-zero if any hour/day/week bucket differs from summing the posts.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER_ID = 'analytics-check'
+
+
+def seed(db, posts, days):
+    from models import Post, User
+    import rollups
+
+    now = datetime.now()
+    rng = random.Random(7)
+    db.session.execute(Post.__table__.delete().where(Post.user_id == USER_ID))
+    if db.session.get(User, USER_ID) is None:
+        db.session.add(User(id=USER_ID, email='analytics-check@example.com'))
+    db.session.execute(Post.__table__.insert(), [{
+        'user_id': USER_ID,
+        'product_title': 'Product',
+        'amazon_url': 'https://amazon.com/dp/x',
+        'affiliate_url': 'https://amazon.com/dp/x?tag=t',
+        'clicks': rng.randint(0, 50),
+        'revenue_estimated': round(rng.random() * 10, 2),
+        'posted_to_discord': rng.random() < 0.5,
+        'created_at': now - timedelta(minutes=rng.randrange(days * 24 * 60)),
+    } for _ in range(posts)])
+    rollups.rebuild(USER_ID)
+
+
+def expected(posts, start, end, granularity):
+    """{bucket label: (posts, clicks)} from the posts themselves"""
+    from analytics_dashboard import _truncate
+
+    label_format = '%Y-%m-%d %H:00' if granularity == 'hour' else '%Y-%m-%d'
+    first_bucket = _truncate(start, granularity)
+    totals = defaultdict(lambda: [0, 0])
+    for post in posts:
+        if post.created_at >= first_bucket:
+            bucket = totals[_truncate(post.created_at, granularity).strftime(label_format)]
+            bucket[0] += 1
+            bucket[1] += post.clicks
+    return {label: tuple(counts) for label, counts in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'analytics_check.sqlite3')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import app, db
+    from analytics_dashboard import AnalyticsDashboard
+    from models import Post, User
+
+    failures = 0
+    with app.app_context():
+        seed(db, args.posts, args.days)
+        dashboard = AnalyticsDashboard(db.session.get(User, USER_ID))
+        posts = Post.query.filter_by(user_id=USER_ID).all()
+        end = datetime.now()
+        for granularity, days in (('hour', 3), ('day', 30), ('week', args.days)):
+            start = end - timedelta(days=days)
+            want = expected(posts, start, end, granularity)
+            got = {row['date']: (row['posts'], row['clicks'])
+                   for row in dashboard._get_daily_stats(start, end, granularity) if row['posts']}
+            wrong = sorted(label for label in want.keys() | got.keys() if want.get(label) != got.get(label))
+            failures += bool(wrong)
+            print(f"{'MISMATCH' if wrong else 'ok':9} {granularity:5} {len(want)} buckets, "
+                  f"{sum(p for p, _ in want.values())} posts on {db.engine.dialect.name}")
+            for label in wrong[:5]:
+                print(f'          {label}: expected {want.get(label)}, got {got.get(label)}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Parser Benchmark - html.parser full tree vs incremental lxml containers
+
+Usage:
+    python benchmarks/parse_benchmark.py [--limit N] [bestsellers|search:PAGE.html ...]
+
+Pass pages saved from Amazon (e.g. with "Save Page As" or curl) prefixed
+with their kind. With no pages, synthetic multi-megabyte fixtures are used.
+Each run happens in a fresh process so peak RSS is measured per parser.
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+import product_parser  # noqa: E402
+
+LEGACY_MATCHERS = {
+    'bestsellers': ('div', {'class': re.compile('zg-grid-general-faceout')}),
+    'search': ('div', {'data-component-type': 's-search-result'}),
+}
+
+FAST_PARSERS = {
+    'bestsellers': product_parser.find_bestseller_containers,
+    'search': product_parser.find_search_result_containers,
+}
+
+
+def synthetic_page(kind, products=60, filler_kb=3000):
+    """Build a page shaped like Amazon's: product cards buried in markup"""
+    filler = '<div class="nav-item"><span>menu entry</span><a href="/x">link</a></div>' * (filler_kb * 1024 // 72 // 2)
+    script = '<script>var data = "%s";</script>' % ('x' * 2048)
+    cards = []
+    for i in range(products):
+        asin = f'B0{i:08d}'
+        if kind == 'bestsellers':
+            cards.append(
+                f'<div class="a-section zg-grid-general-faceout">'
+                f'<a class="a-link-normal" href="/Product-{i}/dp/{asin}/ref=zg">'
+                f'<img src="https://m.media-amazon.com/images/I/{i}.jpg">'
+                f'<div class="p13n-sc-truncate">Product number {i}</div></a>'
+                f'<span class="a-icon-alt">4.5 out of 5 stars</span>'
+                f'<span class="p13n-sc-price">${i}.99</span></div>'
+            )
+        else:
+            cards.append(
+                f'<div data-component-type="s-search-result" data-asin="{asin}">'
+                f'<h2 class="a-size-mini"><a href="/dp/{asin}">Product number {i}</a></h2>'
+                f'<span class="a-price"><span class="a-offscreen">${i}.99</span></span>'
+                f'<span class="a-icon-alt">4.5 out of 5 stars</span>'
+                f'<img class="s-image" src="https://m.media-amazon.com/images/I/{i}.jpg"></div>'
+            )
+    body = filler + script * 50 + ''.join(cards) + filler
+    return f'<html><head><title>Amazon</title></head><body>{body}</body></html>'.encode('utf-8')
+
+
+def _legacy(kind, content, limit):
+    soup = BeautifulSoup(content, 'html.parser')
+    name, attrs = LEGACY_MATCHERS[kind]
+    return soup.find_all(name, attrs)[:limit]
+
+
+def _fast(kind, content, limit):
+    return FAST_PARSERS[kind](content, limit)
+
+
+def _measure(parser_name, kind, content, limit, queue):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    parse = _legacy if parser_name == 'html.parser' else _fast
+    start = time.process_time()
+    containers = parse(kind, content, limit)
+    cpu = time.process_time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    queue.put((len(containers), cpu, peak))
+
+
+def run(parser_name, kind, content, limit):
+    """Run one parse in a child process and return (containers, cpu_s, peak_kb)"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(parser_name, kind, content, limit, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--limit', type=int, default=20)
+    arg_parser.add_argument('pages', nargs='*', help='kind:path, kind is bestsellers or search')
+    args = arg_parser.parse_args()
+
+    fixtures = []
+    for page in args.pages:
+        kind, _, path = page.partition(':')
+        with open(path, 'rb') as f:
+            fixtures.append((f'{kind}:{os.path.basename(path)}', kind, f.read()))
+    if not fixtures:
+        fixtures = [(f'{kind}:synthetic', kind, synthetic_page(kind)) for kind in FAST_PARSERS]
+
+    print(f"{'fixture':32} {'size':>8} {'parser':12} {'found':>5} {'cpu ms':>9} {'peak kB':>9}")
+    for label, kind, content in fixtures:
+        for parser_name in ('html.parser', 'lxml-stream'):
+            found, cpu, peak = run(parser_name, kind, content, args.limit)
+            print(f'{label:32} {len(content) // 1024:>6}kB {parser_name:12} {found:>5} {cpu * 1000:>9.1f} {peak:>9}')
+
+
+if __name__ == '__main__':
+    main()
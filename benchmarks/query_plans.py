@@ -0,0 +1,155 @@
+"""
+Query Plan Check - Seed a large dataset and EXPLAIN the hot model queries
+
+Usage:
+    python benchmarks/query_plans.py [--posts N] [--database-url URL]
+
+Without --database-url a throwaway SQLite file is used. A PostgreSQL URL must
+point at a scratch database: it is filled with generated rows. Exits non-zero
+if any hot query falls back to a full table scan.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATEGORIES = ['Electronics', 'Gaming', 'Smart Home', 'Kitchen', 'Outdoor', 'Books', 'Toys', 'Health']
+
+
+def hot_queries(user_id, now):
+    """The queries the dashboard, selector and analytics run on every view"""
+    from inventory_manager import not_promoted_since
+    from models import Post, ProductInventory, WebhookDestination
+
+    return {
+        'dashboard last post': Post.query.filter_by(user_id=user_id).order_by(Post.created_at.desc()).limit(1),
+        'posts in window': Post.query.filter(Post.user_id == user_id, Post.created_at >= now - timedelta(days=30)),
+        'posts in day': Post.query.filter(
+            Post.user_id == user_id,
+            Post.created_at >= now - timedelta(days=1),
+            Post.created_at < now,
+        ),
+        'posts by asin': Post.query.filter(Post.asin == 'B000000042'),
+        'products to promote': ProductInventory.query.filter(ProductInventory.is_active == True)
+        .order_by(ProductInventory.conversion_rate.desc()).limit(10),
+        'active products in category': ProductInventory.query.filter(
+            ProductInventory.is_active == True,
+            ProductInventory.category == 'Electronics',
+        ),
+        'ai recommended': ProductInventory.query.filter(ProductInventory.is_active == True)
+        .order_by(ProductInventory.ai_score.desc()).limit(10),
+        'not promoted this week': ProductInventory.query.filter(
+            ProductInventory.is_active == True,
+            not_promoted_since(user_id, now - timedelta(days=7)),
+        ).order_by(ProductInventory.conversion_rate.desc()).limit(10),
+        'user webhooks': WebhookDestination.query.filter_by(user_id=user_id, is_active=True),
+    }
+
+
+def seed(db, posts, products, users):
+    from models import Post, ProductInventory, User, WebhookDestination
+
+    now = datetime.now()
+    rng = random.Random(42)
+
+    def insert(model, rows, chunk=5000):
+        for i in range(0, len(rows), chunk):
+            db.session.execute(model.__table__.insert(), rows[i:i + chunk])
+
+    insert(User, [{'id': f'user-{u}', 'email': f'user{u}@example.com'} for u in range(users)])
+    insert(ProductInventory, [{
+        'asin': f'B{p:09d}',
+        'product_title': f'Product {p}',
+        'category': rng.choice(CATEGORIES),
+        'price': f'${rng.randint(5, 500)}.99',
+        'rating': rng.uniform(3, 5),
+        'conversion_rate': rng.random(),
+        'times_promoted': rng.randint(0, 30),
+        'is_active': rng.random() < 0.9,
+        'is_trending': rng.random() < 0.05,
+    } for p in range(products)])
+    insert(Post, [{
+        'user_id': f'user-{rng.randrange(users)}',
+        'product_title': 'Product',
+        'amazon_url': 'https://amazon.com/dp/x',
+        'affiliate_url': 'https://amazon.com/dp/x?tag=t',
+        'asin': f'B{rng.randrange(products):09d}',
+        'category': rng.choice(CATEGORIES),
+        'clicks': rng.randint(0, 100),
+        'impressions': rng.randint(0, 1000),
+        'revenue_estimated': rng.random() * 10,
+        'conversion_rate': rng.random(),
+        'posted_to_discord': rng.random() < 0.5,
+        'created_at': now - timedelta(minutes=rng.randrange(365 * 24 * 60)),
+    } for _ in range(posts)])
+    insert(WebhookDestination, [{
+        'user_id': f'user-{u}',
+        'name': f'hook {u}-{h}',
+        'platform': 'discord',
+        'webhook_url': 'https://discord.com/api/webhooks/x',
+        'is_active': h != 0,
+    } for u in range(users) for h in range(3)])
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def explain(db, query):
+    """Return the plan lines for a query on the current database"""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    dialect = db.engine.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def is_full_scan(plan, dialect):
+    for line in plan:
+        if dialect == 'sqlite' and line.startswith('SCAN ') and 'INDEX' not in line:
+            return True
+        if dialect == 'postgresql' and 'Seq Scan' in line:
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=200000)
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'query_plans.sqlite3')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import app, db
+
+    failures = 0
+    with app.app_context():
+        seed(db, args.posts, args.products, args.users)
+        dialect = db.engine.dialect.name
+        for name, query in hot_queries('user-7', datetime.now()).items():
+            plan = explain(db, query)
+            full_scan = is_full_scan(plan, dialect)
+            failures += full_scan
+            print(f"{'FULL SCAN' if full_scan else 'index':10} {name}")
+            for line in plan:
+                print(f'           {line}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Scoring Benchmark - per-object scalar scorer vs NumPy batch scorer
+
+Usage:
+    python benchmarks/score_benchmark.py [--sizes 10000,100000,1000000] [--top N]
+
+Generates synthetic inventories (including NULL ratings, unparsed prices and
+uncategorised products), checks that the batch scores equal the scalar ones
+exactly and that top-k matches a stable sort, then reports wall time for both.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from batch_scoring import InventoryScores  # noqa: E402
+from scoring import calculate_ai_score  # noqa: E402
+
+CATEGORIES = ['Electronics', 'Gaming', 'Smart Home', 'Kitchen', 'Outdoor', 'Books', None]
+
+
+def synthetic_products(n, seed=42):
+    rng = random.Random(seed)
+    products = []
+    for i in range(n):
+        priced = rng.random() < 0.95
+        products.append(SimpleNamespace(
+            asin=f'B{i:09d}',
+            rating=None if rng.random() < 0.05 else round(rng.uniform(1, 5), 1),
+            price=f'${rng.randint(1, 600)}.99' if priced else None,
+            price_cents=rng.choice([None, rng.randint(100, 60000)]) if priced else None,
+            times_promoted=rng.randint(0, 30),
+            conversion_rate=None if rng.random() < 0.1 else rng.random(),
+            is_trending=rng.random() < 0.05,
+            category=rng.choice(CATEGORIES),
+        ))
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'products':>10} {'scalar':>10} {'batch':>10} {'speedup':>8}  identical")
+    for n in (int(size) for size in args.sizes.split(',')):
+        products = synthetic_products(n)
+
+        start = time.perf_counter()
+        scalar = [calculate_ai_score(p) for p in products]
+        scalar_top = sorted(range(n), key=scalar.__getitem__, reverse=True)[:args.top]
+        scalar_time = time.perf_counter() - start
+
+        inventory = InventoryScores.from_products(products)
+        start = time.perf_counter()
+        scores = inventory.scores()
+        batch_top = inventory.top_k(args.top, scores)
+        batch_time = time.perf_counter() - start
+
+        identical = np.array_equal(scores, np.array(scalar)) and list(batch_top) == scalar_top
+        print(f'{n:>10} {scalar_time:>9.3f}s {batch_time:>9.3f}s {scalar_time / batch_time:>7.1f}x  {identical}')
+        if not identical:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
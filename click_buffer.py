@@ -0,0 +1,198 @@
+"""
+Click Buffer - Write-behind counting for post clicks and impressions
+Clicks and impressions only add to in-memory counters; a background thread per
+counter writes the pending counts every few seconds with one batched UPDATE
+(see counters.py), sooner if many posts are waiting, and once more when the
+worker exits
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy.exc import DataError
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes; 0 writes every count straight through
+FLUSH_INTERVAL = float(os.environ.get('CLICK_FLUSH_INTERVAL', 5))
+# Flush early once this many distinct posts have pending counts
+MAX_PENDING_POSTS = int(os.environ.get('CLICK_BUFFER_MAX_POSTS', 5000))
+
+
+class ClickBuffer:
+    """Per-process counts of one Post column waiting to be written
+
+    column is 'clicks' or 'impressions'; flushes go through the matching
+    counters.increment_post_<column> function.
+    """
+
+    def __init__(self, column='clicks', flush_interval=FLUSH_INTERVAL, max_pending_posts=MAX_PENDING_POSTS):
+        self.column = column
+        self.flush_interval = flush_interval
+        self.max_pending_posts = max_pending_posts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._oldest_pending = None  # monotonic time of the oldest unflushed count
+        self._wake = threading.Event()
+        self._pid = None
+        self.stats = {
+            'recorded': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'flush_failures': 0,
+            'dropped': 0,
+            'last_flush_seconds': None,
+            'last_flush_at': None,
+        }
+
+    def add(self, post_id, count=1):
+        """Count clicks (or impressions) on a post; written on the next flush"""
+        with self._lock:
+            self._start_flusher()
+            if not self._pending:
+                self._oldest_pending = time.monotonic()
+            self._pending[post_id] += count
+            self.stats['recorded'] += count
+            full = len(self._pending) >= self.max_pending_posts
+
+        if self.flush_interval <= 0:
+            self.flush()
+        elif full:
+            self._wake.set()
+
+    def flush(self):
+        """Write all pending counts in one transaction; returns the total written
+
+        On failure the counts go back into the buffer for the next attempt,
+        except for posts the database rejects outright (see _write_each).
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                oldest, self._oldest_pending = self._oldest_pending, None
+            if not pending:
+                return 0
+
+            start = time.monotonic()
+            retry, dropped = Counter(), 0
+            try:
+                self._write(pending)
+            except DataError as e:
+                logger.warning(f"{self.column.capitalize()} flush rejected, writing posts one at a time: {e.orig}")
+                retry, dropped = self._write_each(pending)
+            except Exception as e:
+                logger.error(f"{self.column.capitalize()} flush failed, keeping {sum(pending.values())} buffered: {e}")
+                retry = pending
+
+            flushed = sum(pending.values()) - sum(retry.values()) - dropped
+            with self._lock:
+                self.stats['flushed'] += flushed
+                self.stats['dropped'] += dropped
+                if retry:
+                    self._pending.update(retry)
+                    if self._oldest_pending is None or oldest < self._oldest_pending:
+                        self._oldest_pending = oldest
+                    self.stats['flush_failures'] += 1
+                else:
+                    self.stats['flushes'] += 1
+                    self.stats['last_flush_seconds'] = round(time.monotonic() - start, 4)
+                    self.stats['last_flush_at'] = time.time()
+            return flushed
+
+    def _write(self, counts):
+        from app import app
+        import counters
+
+        with app.app_context():
+            getattr(counters, f'increment_post_{self.column}')(counts)
+
+    def _write_each(self, pending):
+        """Write posts one at a time after the database rejected a batch
+
+        A count the column can't hold (out of INTEGER range, say) would fail
+        every later flush if re-queued, so posts rejected with a DataError are
+        dropped and logged. Returns (counts to retry, count dropped).
+        """
+        retry, dropped = Counter(), 0
+        for post_id, count in pending.items():
+            try:
+                self._write({post_id: count})
+            except DataError as e:
+                logger.error(f"Dropping {count} {self.column} for post {post_id}: {e.orig}")
+                dropped += count
+            except Exception as e:
+                logger.error(f"{self.column.capitalize()} write failed for post {post_id}, keeping it buffered: {e}")
+                retry[post_id] = count
+        return retry, dropped
+
+    def get_stats(self):
+        """Buffer depth, flush lag and flush counters"""
+        with self._lock:
+            lag = time.monotonic() - self._oldest_pending if self._oldest_pending is not None else 0.0
+            return {
+                **self.stats,
+                'pending_posts': len(self._pending),
+                'pending_count': sum(self._pending.values()),
+                'flush_lag_seconds': round(lag, 3),
+                'flush_interval': self.flush_interval,
+            }
+
+    def _start_flusher(self):
+        """Start this process's flush thread (call with _lock held)
+
+        Forked workers inherit the object but not the thread, so this runs
+        again in each new process; counts copied from the parent are the
+        parent's to flush.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending.clear()
+        self._oldest_pending = None
+        # Graceful shutdown (SIGTERM in gunicorn, Ctrl-C locally) runs atexit
+        atexit.register(self.flush)
+        if self.flush_interval > 0:
+            threading.Thread(target=self._run, name=f'{self.column}-buffer-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_buffer(column='clicks'):
+    """Get the process-wide buffer for a Post counter column"""
+    buffer = _buffers.get(column)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.setdefault(column, ClickBuffer(column))
+    return buffer
+
+
+def record_click(post_id):
+    """Count one click on a post through the shared buffer"""
+    get_buffer('clicks').add(post_id)
+
+
+def record_impressions(post_id, count=1):
+    """Count impressions of a post through the shared buffer"""
+    get_buffer('impressions').add(post_id, count)
+
+
+def get_click_stats():
+    """Get the shared click buffer's depth, lag and flush counters"""
+    return get_buffer('clicks').get_stats()
+
+
+def get_impression_stats():
+    """Get the shared impression buffer's depth, lag and flush counters"""
+    return get_buffer('impressions').get_stats()
@@ -0,0 +1,298 @@
+"""
+Click Event Log - Record who clicked what, when, without slowing the redirect
+record() only classifies the request and puts a tuple on an in-process queue;
+a writer thread bulk-inserts click_events rows in batches of hundreds. Raw
+events older than CLICK_EVENT_RETENTION_DAYS are folded into
+click_daily_stats (per user, day, hour, source and UA class) and deleted.
+
+Usage:
+    python click_events.py --roll-up [--days N]    # run from a daily scheduler
+"""
+import argparse
+import atexit
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import app, db
+from click_filter import classify_user_agent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get('CLICK_EVENT_BATCH_SIZE', 500))
+# Longest a queued event waits for its batch to fill
+FLUSH_INTERVAL = float(os.environ.get('CLICK_EVENT_FLUSH_INTERVAL', 2))
+# Events beyond this are dropped (and counted) rather than blocking redirects
+MAX_QUEUED = int(os.environ.get('CLICK_EVENT_MAX_QUEUED', 50000))
+RETENTION_DAYS = int(os.environ.get('CLICK_EVENT_RETENTION_DAYS', 30))
+# Tries per event before a batch that keeps failing is dropped
+WRITE_ATTEMPTS = int(os.environ.get('CLICK_EVENT_WRITE_ATTEMPTS', 5))
+# Seconds the writer thread waits for its last batch at exit
+SHUTDOWN_TIMEOUT = 5
+
+# Queued to tell the writer thread to finish its batch and stop
+_STOP = object()
+
+
+def _hash(value):
+    """Short keyed hash, so stored values can be grouped but not reversed"""
+    if not value:
+        return None
+    key = app.secret_key.encode('utf-8')
+    return hmac.new(key, value.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def hash_referrer(referrer):
+    """Hash of the referring host; the path and query are not kept"""
+    host = urlparse(referrer).hostname if referrer else None
+    if host and host.startswith('www.'):
+        host = host[4:]
+    return _hash(host)
+
+
+def hour_of_day(column):
+    """SQL for the hour (0-23) of a timestamp column"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return cast(func.strftime('%H', column), Integer)
+    return cast(func.extract('hour', column), Integer)
+
+
+def client_ip(environ):
+    """The client address as ProxyFix (x_for=1) would see it"""
+    forwarded = environ.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return environ.get('REMOTE_ADDR')
+
+
+class ClickEventLog:
+    """Queue of click events and the thread that writes them"""
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_queued=MAX_QUEUED):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._writer = None
+        self.stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'write_failures': 0, 'retried': 0}
+
+    def record(self, post_id, environ, ua_class=None):
+        """Queue a click from a WSGI environ; never blocks"""
+        self._start_writer()
+        if ua_class is None:
+            ua_class = classify_user_agent(environ.get('HTTP_USER_AGENT'))
+        event = (
+            post_id,
+            datetime.now(),
+            hash_referrer(environ.get('HTTP_REFERER')),
+            ua_class,
+            _hash(client_ip(environ)),
+            0,  # failed write attempts
+        )
+        try:
+            self._queue.put_nowait(event)
+            self.stats['recorded'] += 1
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def write_pending(self):
+        """Insert everything queued now, in batches; returns rows written"""
+        written = 0
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return written
+            written += self._insert(batch)
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        """Write everything, including the batch the writer thread holds
+
+        Stops the writer, which writes its batch on the way out, then drains
+        the queue. Registered to run at exit.
+        """
+        writer = self._writer
+        if writer is not None and writer.is_alive() and self._pid == os.getpid():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+                writer.join(timeout)
+            except queue.Full:
+                logger.warning("Click event writer did not drain the queue before exit")
+        self.write_pending()
+
+    def get_stats(self):
+        return {**self.stats, 'queued': self._queue.qsize()}
+
+    def _take(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                batch.append(event)
+        return batch
+
+    def _insert(self, batch):
+        from models import ClickEvent
+
+        rows = [
+            {'post_id': post_id, 'ts': ts, 'referrer_hash': referrer_hash, 'ua_class': ua_class, 'ip_hash': ip_hash}
+            for post_id, ts, referrer_hash, ua_class, ip_hash, _ in batch
+        ]
+        try:
+            with app.app_context():
+                db.session.execute(ClickEvent.__table__.insert(), rows)
+                db.session.commit()
+        except Exception as e:
+            # Queue the events again unless they've used up their attempts
+            requeued = 0
+            for event in batch:
+                if event[-1] + 1 >= WRITE_ATTEMPTS:
+                    continue
+                try:
+                    self._queue.put_nowait(event[:-1] + (event[-1] + 1,))
+                except queue.Full:
+                    break
+                requeued += 1
+            logger.error(f"Could not write {len(rows)} click events, {requeued} queued again: {e}")
+            self.stats['write_failures'] += 1
+            self.stats['retried'] += requeued
+            self.stats['dropped'] += len(rows) - requeued
+            return 0
+        self.stats['written'] += len(rows)
+        self.stats['batches'] += 1
+        return len(rows)
+
+    def _start_writer(self):
+        """Start this process's writer thread on first use (and after fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            atexit.register(self.close)
+            self._writer = threading.Thread(target=self._run, name='click-event-writer', daemon=True)
+            self._writer.start()
+
+    def _run(self):
+        while True:
+            # Sleep until there is an event, then give the batch a little time to fill
+            batch = []
+            event = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while event is not _STOP:
+                batch.append(event)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch and not self._insert(batch) and event is not _STOP:
+                # Give the database a moment before the requeued events come round
+                time.sleep(self.flush_interval)
+            if event is _STOP:
+                return
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    """Get the process-wide click event log"""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = ClickEventLog()
+    return _log
+
+
+def record_click_event(post_id, environ, ua_class=None):
+    """Queue a click event for a post from the request's WSGI environ"""
+    get_log().record(post_id, environ, ua_class)
+
+
+def get_click_event_stats():
+    return get_log().get_stats()
+
+
+def roll_up_old_events(retention_days=RETENTION_DAYS, commit=True):
+    """Fold events from before the retention window into click_daily_stats
+
+    Whole days are rolled up at once, so each (day, hour) group is counted
+    in a single pass and its unique visitor count stays exact. Returns the
+    number of events removed. Run it from one scheduler, not every worker.
+    """
+    from models import ClickDailyStat, ClickEvent, Post
+
+    cutoff = (datetime.now() - timedelta(days=retention_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    dialect = db.session.get_bind().dialect.name
+
+    day = func.date(ClickEvent.ts)
+    hour = hour_of_day(ClickEvent.ts)
+    referrer = func.coalesce(ClickEvent.referrer_hash, '')
+
+    summary = (
+        select(
+            Post.user_id, day, hour, referrer, ClickEvent.ua_class,
+            func.count(ClickEvent.id),
+            func.count(func.distinct(ClickEvent.ip_hash))
+        )
+        .join(Post, Post.id == ClickEvent.post_id)
+        .where(ClickEvent.ts < cutoff)
+        .group_by(Post.user_id, day, hour, referrer, ClickEvent.ua_class)
+    )
+
+    table = ClickDailyStat.__table__
+    upsert = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(table)
+    stmt = upsert.from_select(
+        ['user_id', 'day', 'hour', 'referrer_hash', 'ua_class', 'clicks', 'unique_visitors'],
+        summary
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day, table.c.hour, table.c.referrer_hash, table.c.ua_class],
+        set_={
+            'clicks': table.c.clicks + stmt.excluded.clicks,
+            'unique_visitors': table.c.unique_visitors + stmt.excluded.unique_visitors,
+        }
+    )
+    db.session.execute(stmt)
+    removed = db.session.execute(
+        ClickEvent.__table__.delete().where(ClickEvent.ts < cutoff)
+    ).rowcount
+
+    if commit:
+        db.session.commit()
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the click event log')
+    parser.add_argument('--roll-up', action='store_true', help='fold old events into click_daily_stats')
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help='days of raw events to keep')
+    args = parser.parse_args()
+
+    if args.roll_up:
+        with app.app_context():
+            print(f"Rolled up {roll_up_old_events(args.days)} click events")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
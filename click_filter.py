@@ -0,0 +1,173 @@
+"""
+Click Filter - Keep unfurl bots and repeat hits out of the click counters
+Chat apps fetch every posted link to build a preview, and people refresh.
+should_count() classifies the user agent with precompiled patterns and checks
+(post, client) against a rotating Bloom filter: fixed memory, a few hashes per
+click, no database. should_count_impression() applies the same window to
+impressions, where an unfurl fetch is a view of the post rather than noise.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+# How long a repeat click from the same client on the same post is ignored
+DEDUP_WINDOW = float(os.environ.get('CLICK_DEDUP_WINDOW', 1800))
+# Distinct (post, client) pairs per window before the false positive rate climbs
+DEDUP_CAPACITY = int(os.environ.get('CLICK_DEDUP_CAPACITY', 200000))
+DEDUP_ERROR_RATE = float(os.environ.get('CLICK_DEDUP_ERROR_RATE', 0.001))
+
+# Patterns are matched against the lowercased user agent.
+# Link preview fetchers, named so they can be told apart from generic bots
+UNFURL_AGENTS = re.compile(
+    r'discordbot|slackbot|slack-imgproxy|telegrambot|twitterbot|facebookexternalhit|facebot'
+    r'|whatsapp|linkedinbot|skypeuripreview|redditbot|pinterestbot|embedly|iframely'
+    r'|vkshare|mastodon|applebot|google-pagerenderer|bitlybot|snap url preview'
+)
+OTHER_BOT_AGENTS = re.compile(
+    r'bot\b|bot/|crawl|spider|slurp|preview|headless|python-requests|curl/|wget/|httpclient'
+    r'|go-http-client|okhttp|axios/|node-fetch|scrapy|monitor|uptime'
+)
+MOBILE_AGENTS = re.compile(r'mobi|android|iphone|ipad')
+
+NOT_COUNTED = ('unfurl', 'bot')
+# A preview fetch means the post was shown in a channel, so it is an impression
+NOT_COUNTED_AS_IMPRESSION = ('bot',)
+
+
+@lru_cache(maxsize=4096)
+def classify_user_agent(user_agent):
+    """Client class: unfurl, bot, mobile, desktop or unknown
+
+    A handful of user agent strings make up nearly all traffic, so results
+    are memoised and the regexes only run for new ones.
+    """
+    if not user_agent:
+        return 'unknown'
+    user_agent = user_agent.lower()
+    if UNFURL_AGENTS.search(user_agent):
+        return 'unfurl'
+    if OTHER_BOT_AGENTS.search(user_agent):
+        return 'bot'
+    if MOBILE_AGENTS.search(user_agent):
+        return 'mobile'
+    return 'desktop'
+
+
+class RotatingBloomFilter:
+    """Set membership over a sliding time window in constant memory
+
+    Two generations of bits: keys are added to the current one and looked up
+    in both. Every `window` seconds the older generation is dropped, so a key
+    is remembered for between one and two windows. No false negatives within
+    a window; false positives at about error_rate when `capacity` keys arrive
+    per window.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, capacity=DEDUP_CAPACITY, error_rate=DEDUP_ERROR_RATE):
+        self.window = window
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._current = bytearray((self.num_bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """Add a key; returns True if it was (probably) already present"""
+        positions = self._positions(key)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._rotated_at >= self.window:
+                # Skip straight to empty if a whole window went by unseen
+                self._previous = self._current if now - self._rotated_at < 2 * self.window else bytearray(len(self._current))
+                self._current = bytearray(len(self._current))
+                self._rotated_at = now
+
+            current, previous = self._current, self._previous
+            seen = all(current[p >> 3] & (1 << (p & 7)) for p in positions) or \
+                all(previous[p >> 3] & (1 << (p & 7)) for p in positions)
+            for p in positions:
+                current[p >> 3] |= 1 << (p & 7)
+            return seen
+
+    @property
+    def memory_bytes(self):
+        return len(self._current) * 2
+
+
+class ClickFilter:
+    """Decides which clicks count, with counters for what it filtered"""
+
+    def __init__(self, window=DEDUP_WINDOW, capacity=DEDUP_CAPACITY, error_rate=DEDUP_ERROR_RATE):
+        self.seen = RotatingBloomFilter(window, capacity, error_rate)
+        self.stats = {
+            'counted': 0, 'duplicates': 0, 'unfurl': 0, 'bot': 0,
+            'impressions': 0, 'duplicate_impressions': 0, 'impression_bots': 0,
+        }
+
+    def check(self, post_id, client, user_agent):
+        """Return (count_it, ua_class) for a click from client (e.g. an IP)"""
+        ua_class = classify_user_agent(user_agent)
+        if ua_class in NOT_COUNTED:
+            self.stats[ua_class] += 1
+            return False, ua_class
+
+        key = f'{post_id}\x00{client}\x00{user_agent}'.encode('utf-8', 'replace')
+        if self.seen.add(key):
+            self.stats['duplicates'] += 1
+            return False, ua_class
+
+        self.stats['counted'] += 1
+        return True, ua_class
+
+    def check_impression(self, post_id, client, user_agent):
+        """Return (count_it, ua_class) for a view of a post by client"""
+        ua_class = classify_user_agent(user_agent)
+        if ua_class in NOT_COUNTED_AS_IMPRESSION:
+            self.stats['impression_bots'] += 1
+            return False, ua_class
+
+        # Own key space, so a view doesn't swallow the click that follows it
+        key = f'i{post_id}\x00{client}\x00{user_agent}'.encode('utf-8', 'replace')
+        if self.seen.add(key):
+            self.stats['duplicate_impressions'] += 1
+            return False, ua_class
+
+        self.stats['impressions'] += 1
+        return True, ua_class
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'dedup_window_seconds': self.seen.window,
+            'filter_bytes': self.seen.memory_bytes,
+            'hash_functions': self.seen.num_hashes,
+        }
+
+
+_filter = ClickFilter()
+
+
+def should_count(post_id, client, user_agent):
+    """Check a click against the process-wide filter: (count_it, ua_class)"""
+    return _filter.check(post_id, client, user_agent)
+
+
+def should_count_impression(post_id, client, user_agent):
+    """Check a view against the process-wide filter: (count_it, ua_class)"""
+    return _filter.check_impression(post_id, client, user_agent)
+
+
+def get_filter_stats():
+    return _filter.get_stats()
@@ -0,0 +1,195 @@
+"""
+Click Redirects - Answer /api/track-click/<post_id> below Flask
+ClickRedirectMiddleware serves the affiliate redirect straight from WSGI: no
+request context, session cookie, before_request hooks or Flask-Login. The
+post's affiliate URL comes from a bounded in-process LRU that new posts are
+added to when they commit, so a click normally costs a dict lookup, a
+click_filter check and a click_buffer increment; only a cold post reads the
+database. The impression pixel /api/impression/<post_id>.gif is served the
+same way, and an unfurl bot fetching a tracked link counts as an impression.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.urls import iri_to_uri
+
+from app import app, db
+from models import Post
+import click_buffer
+import click_events
+import click_filter
+
+CACHE_SIZE = 50000
+
+TRACK_CLICK_PATH = re.compile(r'^/api/track-click/(\d+)$')
+PIXEL_PATH = re.compile(r'^/api/impression/(\d+)\.gif$')
+
+# 1x1 transparent GIF
+PIXEL_GIF = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff'
+    b'!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
+
+class AffiliateUrlCache:
+    """Bounded LRU of post id -> affiliate URL"""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, post_id):
+        with self._lock:
+            url = self._urls.get(post_id)
+            if url is None:
+                self.stats['misses'] += 1
+            else:
+                self.stats['hits'] += 1
+                self._urls.move_to_end(post_id)
+            return url
+
+    def put(self, post_id, url):
+        with self._lock:
+            self._urls[post_id] = url
+            self._urls.move_to_end(post_id)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+
+    def discard(self, post_id):
+        with self._lock:
+            self._urls.pop(post_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'entries': len(self._urls), 'max_entries': self.max_entries}
+
+
+_cache = AffiliateUrlCache()
+
+
+def lookup_affiliate_url(post_id):
+    """The post's affiliate URL, from the cache or else the database"""
+    url = _cache.get(post_id)
+    if url is None:
+        with app.app_context():
+            url = db.session.query(Post.affiliate_url).filter(Post.id == post_id).scalar()
+        if url is not None:
+            url = iri_to_uri(url)
+            _cache.put(post_id, url)
+    return url
+
+
+def get_redirect_cache_stats():
+    return _cache.get_stats()
+
+
+# Warm the cache with posts as they're created, but only once they commit:
+# a rolled-back post's id can be handed to a different post later
+@event.listens_for(Post, 'after_insert')
+def _remember_new_post(mapper, connection, post):
+    session = Session.object_session(post)
+    if session is not None:
+        session.info.setdefault('new_post_urls', []).append((post.id, post.affiliate_url))
+
+
+@event.listens_for(Post, 'after_delete')
+def _forget_deleted_post(mapper, connection, post):
+    _cache.discard(post.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _warm_committed_posts(session):
+    for post_id, url in session.info.pop('new_post_urls', ()):
+        _cache.put(post_id, iri_to_uri(url))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_rolled_back_posts(session):
+    session.info.pop('new_post_urls', None)
+
+
+def handle_click(post_id, environ):
+    """Count and log a click on an existing post's tracked link
+
+    Shared by ClickRedirectMiddleware and the track_click route. HEAD comes
+    from link checkers and preview probes, not people: it gets the redirect
+    but isn't counted or logged.
+    """
+    if environ['REQUEST_METHOD'] != 'GET':
+        return
+    # Unfurl bots and repeat clicks are logged but not counted
+    counted, ua_class = click_filter.should_count(
+        post_id, click_events.client_ip(environ), environ.get('HTTP_USER_AGENT')
+    )
+    if counted:
+        click_buffer.record_click(post_id)
+    elif ua_class == 'unfurl':
+        # A preview fetch means the link was shown in a channel
+        count_impression(post_id, environ)
+    click_events.record_click_event(post_id, environ, ua_class)
+
+
+def handle_impression(post_id, environ):
+    """Count an impression pixel fetch if the post exists
+
+    Shared by ClickRedirectMiddleware and the impression_pixel route. Only
+    GET is counted: HEAD is a probe, not a view.
+    """
+    if environ['REQUEST_METHOD'] == 'GET' and lookup_affiliate_url(post_id) is not None:
+        count_impression(post_id, environ)
+
+
+def count_impression(post_id, environ):
+    """Count a view of a post unless it is a bot or a repeat"""
+    counted, _ = click_filter.should_count_impression(
+        post_id, click_events.client_ip(environ), environ.get('HTTP_USER_AGENT')
+    )
+    if counted:
+        click_buffer.record_impressions(post_id)
+
+
+class ClickRedirectMiddleware:
+    """WSGI wrapper that handles click redirects and passes everything else on"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return self.wsgi_app(environ, start_response)
+        path = environ.get('PATH_INFO', '')
+        match = TRACK_CLICK_PATH.match(path)
+        if not match:
+            match = PIXEL_PATH.match(path)
+            if match:
+                return self.pixel(int(match.group(1)), environ, start_response)
+            return self.wsgi_app(environ, start_response)
+
+        post_id = int(match.group(1))
+        url = lookup_affiliate_url(post_id)
+        if url is None:
+            start_response('404 NOT FOUND', [('Content-Type', 'text/plain'), ('Content-Length', '9')])
+            return [b'Not Found']
+
+        handle_click(post_id, environ)
+        start_response('302 FOUND', [
+            ('Location', url),
+            ('Cache-Control', 'no-store'),
+            ('Content-Length', '0'),
+        ])
+        return [b'']
+
+    def pixel(self, post_id, environ, start_response):
+        """Serve the impression pixel; a missing post still gets the image"""
+        handle_impression(post_id, environ)
+        start_response('200 OK', [
+            ('Content-Type', 'image/gif'),
+            ('Cache-Control', 'no-store'),
+            ('Content-Length', str(len(PIXEL_GIF))),
+        ])
+        return [PIXEL_GIF]
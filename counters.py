@@ -0,0 +1,122 @@
+"""
+Atomic Counters - Increment stats columns in SQL instead of read-modify-write
+On PostgreSQL each call is one UPDATE ... FROM (VALUES (key, n), ...); other
+databases get one UPDATE ... SET col = col + :n per distinct increment. Either
+way concurrent workers never lose counts and no SELECT is needed first
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from sqlalchemy import Integer, column as sql_column, func, update, values
+
+from app import db
+from models import Post, ProductInventory
+from scoring import ai_score_sql
+import rollups
+
+# Rows per UPDATE ... FROM (VALUES ...) statement
+VALUES_CHUNK_SIZE = 1000
+
+
+def _group_by_increment(counts):
+    """Turn {key: n} or an iterable of keys into {n: [keys]}"""
+    if not isinstance(counts, dict):
+        counts = Counter(counts)
+    groups = defaultdict(list)
+    for key, n in counts.items():
+        if n:
+            groups[n].append(key)
+    return groups
+
+
+def _execute_increment(column, condition, n, extra_values):
+    """UPDATE rows matching condition to column + n; returns rows updated"""
+    new_value = func.coalesce(column, 0) + n
+    assignments = {column.key: new_value}
+    if callable(extra_values):
+        assignments.update(extra_values(new_value))
+    else:
+        assignments.update(extra_values or {})
+    result = db.session.execute(
+        update(column.class_)
+        .where(condition)
+        .values(assignments)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def _increment_from_values(column, key_column, counts, extra_values):
+    """One UPDATE ... FROM (VALUES ...) per chunk, whatever the increments"""
+    if not isinstance(counts, dict):
+        counts = Counter(counts)
+    items = [(key, n) for key, n in counts.items() if n]
+    updated = 0
+    for i in range(0, len(items), VALUES_CHUNK_SIZE):
+        increments = values(
+            sql_column('key', key_column.type),
+            sql_column('n', Integer),
+            name='increments'
+        ).data(items[i:i + VALUES_CHUNK_SIZE])
+        updated += _execute_increment(column, key_column == increments.c.key, increments.c.n, extra_values)
+    return updated
+
+
+def increment(column, key_column, counts, extra_values=None, commit=True):
+    """Add to a counter column for many rows at once
+
+    counts is {key: n} or an iterable of keys (each occurrence adds 1).
+    extra_values are set on every matched row as well; pass a function to
+    build them from the incremented value's expression. Returns rows updated.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        updated = _increment_from_values(column, key_column, counts, extra_values)
+    else:
+        updated = 0
+        for n, keys in _group_by_increment(counts).items():
+            updated += _execute_increment(column, key_column.in_(keys), n, extra_values)
+    if commit:
+        db.session.commit()
+    return updated
+
+
+def increment_product_promotions(asins, commit=True):
+    """Record promotions for products by ASIN, stamp last_promoted and re-score"""
+    now = datetime.now()
+    return increment(
+        ProductInventory.times_promoted,
+        ProductInventory.asin,
+        asins,
+        extra_values=lambda times_promoted: {
+            'last_promoted': now,
+            'ai_score': ai_score_sql(times_promoted=times_promoted),
+        },
+        commit=commit,
+    )
+
+
+def increment_product_clicks(asin_counts, commit=True):
+    """Add clicks to products' total_clicks by ASIN"""
+    return increment(ProductInventory.total_clicks, ProductInventory.asin, asin_counts, commit=commit)
+
+
+def increment_post_clicks(post_counts, commit=True):
+    """Add clicks to posts by post ID, and to their daily rollup rows"""
+    if not isinstance(post_counts, dict):
+        post_counts = Counter(post_counts)
+    updated = increment(Post.clicks, Post.id, post_counts, commit=False)
+    rollups.add_to_posts('clicks', post_counts)
+    if commit:
+        db.session.commit()
+    return updated
+
+
+def increment_post_impressions(post_counts, commit=True):
+    """Add impressions to posts by post ID, and to their daily rollup rows"""
+    if not isinstance(post_counts, dict):
+        post_counts = Counter(post_counts)
+    updated = increment(Post.impressions, Post.id, post_counts, commit=False)
+    rollups.add_to_posts('impressions', post_counts)
+    if commit:
+        db.session.commit()
+    return updated
@@ -0,0 +1,158 @@
+"""
+Shared Outbound HTTP Client
+Pooled keep-alive session used by the Amazon scraper and searcher
+"""
+import os
+import threading
+import logging
+from email.message import Message
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# (connect, read) timeout in seconds applied when the caller does not pass one
+DEFAULT_TIMEOUT = (5, 15)
+
+# Number of distinct hosts to keep pools for, and keep-alive connections per host
+POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 10))
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))
+
+RETRY_POLICY = Retry(
+    total=3,
+    connect=3,
+    read=2,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(['GET', 'HEAD']),
+    raise_on_status=False,
+)
+
+_stats_lock = threading.Lock()
+_stats = {'opened': 0, 'reused': 0}
+
+
+def _record_connection(conn):
+    """Count whether a checked-out connection still has a live socket"""
+    key = 'reused' if getattr(conn, 'sock', None) is not None else 'opened'
+    with _stats_lock:
+        _stats[key] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        _record_connection(conn)
+        return conn
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        _record_connection(conn)
+        return conn
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with per-host pool sizing and connection reuse counters"""
+
+    def __init__(self, pool_hosts=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE, max_retries=RETRY_POLICY):
+        super().__init__(
+            pool_connections=pool_hosts,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Get the process-wide pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(DEFAULT_HEADERS)
+                adapter = PooledHTTPAdapter()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def request(method, url, **kwargs):
+    """Send a request through the pooled session with the default timeout
+
+    Every request first takes a token from the shared per-host rate limiter.
+    """
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    rate_limiter.acquire(urlparse(url).hostname)
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    """GET a URL through the pooled session"""
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    """HEAD a URL through the pooled session"""
+    return request('HEAD', url, **kwargs)
+
+
+def header_charset(headers):
+    """The charset a Content-Type header names, or None if it names none
+
+    Unlike Response.encoding, which assumes ISO-8859-1 for any text/* type,
+    so a parser can fall back to the page's own <meta charset>.
+    """
+    content_type = headers.get('Content-Type')
+    if not content_type:
+        return None
+    message = Message()
+    message['Content-Type'] = content_type
+    charset = message.get_param('charset')
+    return charset if isinstance(charset, str) and charset else None
+
+
+def get_connection_stats():
+    """Get counts of connections opened vs reused from the keep-alive pool"""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats['opened'] + stats['reused']
+    stats['reuse_ratio'] = stats['reused'] / total if total else 0.0
+    return stats
+
+
+def close_session():
+    """Close all pooled connections (e.g. on worker shutdown)"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -1,15 +1,45 @@
 """
 Product Inventory Manager - Track products and avoid duplicates
 """
+import logging
+import time
 from datetime import datetime, timedelta
+from itertools import islice
+from types import SimpleNamespace
+from sqlalchemy import Float, case, cast, exists, func, literal_column, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from app import db
 from models import ProductInventory, Post
 from amazon_scraper import AmazonProductScraper
+import counters
+from pricing import parse_price
+from scoring import SCORE_INPUTS, ai_score_sql, calculate_ai_score
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT ... ON CONFLICT statement
+UPSERT_CHUNK_SIZE = 500
+# Older SQLite builds cap a statement at 999 bound parameters
+SQLITE_MAX_VARIABLES = 999
+
+
+def not_promoted_since(user_id, since):
+    """Filter for products the user hasn't posted since the given time
+    
+    A correlated NOT EXISTS on (user_id, asin, created_at), so the database
+    probes the index per candidate instead of us loading the user's posts.
+    """
+    return ~exists().where(
+        Post.user_id == user_id,
+        Post.asin == ProductInventory.asin,
+        Post.created_at >= since
+    )
 
 
 class InventoryManager:
     def __init__(self):
         self.scraper = AmazonProductScraper()
+        self.last_refresh_stats = None
     
     def add_product_to_inventory(self, product_data):
         """Add a new product to inventory or update existing"""
@@ -43,60 +73,218 @@ class InventoryManager:
             db.session.commit()
             return product
     
-    def get_products_to_promote(self, user, limit=10):
-        """Get products that haven't been promoted recently by this user"""
-        # Get user's recent posts (last 7 days)
-        recent_posts = Post.query.filter(
-            Post.user_id == user.id,
-            Post.created_at >= datetime.now() - timedelta(days=7)
-        ).all()
+    def add_products_to_inventory(self, products, chunk_size=UPSERT_CHUNK_SIZE, commit=True):
+        """Bulk insert-or-update products by ASIN in chunked statements
+
+        Takes any iterable of product dicts (a list or a generator). Existing
+        rows get their title, price, rating and image refreshed; new rows are
+        inserted. Commits once at the end (unless commit=False, for callers
+        running a larger transaction) and returns inserted/updated counts.
+        """
+        # app.py only starts on PostgreSQL or SQLite
+        dialect = db.session.get_bind().dialect.name
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        if dialect == 'sqlite':
+            chunk_size = min(chunk_size, SQLITE_MAX_VARIABLES // len(self._upsert_row({'asin': ''})))
         
-        recent_asins = [post.asin for post in recent_posts if post.asin]
+        table = ProductInventory.__table__
+        counts = {'inserted': 0, 'updated': 0}
+        rows = (self._upsert_row(p) for p in products if p.get('asin'))
+        
+        while True:
+            # Later duplicates of an ASIN in the same chunk win
+            chunk = list({row['asin']: row for row in islice(rows, chunk_size)}.values())
+            if not chunk:
+                break
+            
+            stmt = insert(table).values(chunk)
+            updated_values = {
+                'product_title': stmt.excluded.product_title,
+                'price': func.coalesce(stmt.excluded.price, table.c.price),
+                # Parsed price follows the price string, even when it no longer parses
+                'price_cents': case(
+                    (stmt.excluded.price.is_(None), table.c.price_cents),
+                    else_=stmt.excluded.price_cents
+                ),
+                'currency': case(
+                    (stmt.excluded.price.is_(None), table.c.currency),
+                    else_=stmt.excluded.currency
+                ),
+                'rating': func.coalesce(stmt.excluded.rating, table.c.rating),
+                'image_url': func.coalesce(stmt.excluded.image_url, table.c.image_url),
+                'updated_at': stmt.excluded.updated_at,
+            }
+            # Score the row as it will be after this update
+            updated_values['ai_score'] = ai_score_sql(
+                **{name: value for name, value in updated_values.items() if name in SCORE_INPUTS}
+            )
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c.asin], set_=updated_values)
+            
+            if dialect == 'postgresql':
+                # xmax is 0 only for rows this statement freshly inserted
+                result = db.session.execute(stmt.returning(literal_column('(xmax = 0)')))
+                inserted = sum(1 for (was_inserted,) in result if was_inserted)
+            else:
+                asins = [row['asin'] for row in chunk]
+                existing = db.session.execute(
+                    select(func.count()).select_from(table).where(table.c.asin.in_(asins))
+                ).scalar()
+                db.session.execute(stmt)
+                inserted = len(chunk) - existing
+            
+            counts['inserted'] += inserted
+            counts['updated'] += len(chunk) - inserted
         
-        # Get products not recently promoted
+        if commit:
+            db.session.commit()
+        return counts
+    
+    def _upsert_row(self, product_data):
+        """Map a scraped product dict onto product_inventory columns"""
+        now = datetime.now()
+        price = product_data.get('price')
+        if 'price_cents' in product_data:
+            price_cents, currency = product_data['price_cents'], product_data.get('currency')
+        else:
+            price_cents, currency = parse_price(price)
+        row = {
+            'asin': product_data.get('asin'),
+            'product_title': (product_data.get('title') or 'Unknown Product')[:200],
+            'category': product_data.get('category', ''),
+            'price': price,
+            'price_cents': price_cents,
+            'currency': currency,
+            'rating': product_data.get('rating'),
+            'image_url': product_data.get('image_url', product_data.get('image')),
+            'times_promoted': 0,
+            'total_clicks': 0,
+            'conversion_rate': 0.0,
+            'is_active': True,
+            'is_trending': False,
+            'created_at': now,
+            'updated_at': now,
+        }
+        row['ai_score'] = calculate_ai_score(SimpleNamespace(**row))
+        return row
+    
+    def get_products_to_promote(self, user, limit=10):
+        """Get products that haven't been promoted recently by this user"""
+        # Get products the user hasn't promoted in the last 7 days
         query = ProductInventory.query.filter(
-            ProductInventory.is_active == True
+            ProductInventory.is_active == True,
+            not_promoted_since(user.id, datetime.now() - timedelta(days=7))
         )
         
-        if recent_asins:
-            query = query.filter(~ProductInventory.asin.in_(recent_asins))
-        
         return query.order_by(ProductInventory.conversion_rate.desc()).limit(limit).all()
     
     def mark_product_promoted(self, asin, user_id):
         """Mark a product as promoted"""
-        product = ProductInventory.query.filter_by(asin=asin).first()
-        if product:
-            product.times_promoted += 1
-            product.last_promoted = datetime.now()
-            db.session.commit()
+        counters.increment_product_promotions([asin])
     
     def update_product_stats(self, asin, clicks=0, conversions=0):
         """Update product performance stats"""
-        product = ProductInventory.query.filter_by(asin=asin).first()
-        if product:
-            product.total_clicks += clicks
-            if product.total_clicks > 0:
-                product.conversion_rate = conversions / product.total_clicks
-            db.session.commit()
+        # SET expressions see the pre-update total_clicks, so add clicks again
+        new_total = func.coalesce(ProductInventory.total_clicks, 0) + clicks
+        new_rate = case(
+            (new_total > 0, cast(conversions, Float) / new_total),
+            else_=ProductInventory.conversion_rate
+        )
+        db.session.execute(
+            update(ProductInventory)
+            .where(ProductInventory.asin == asin)
+            .values(
+                total_clicks=new_total,
+                conversion_rate=new_rate,
+                ai_score=ai_score_sql(conversion_rate=new_rate)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
     
     def refresh_trending_products(self):
-        """Refresh trending products from Amazon"""
+        """Refresh trending products from Amazon
+
+        Runs as one transaction: a bulk upsert of the scraped products, then
+        a single UPDATE that flips is_trending only on rows whose flag changes.
+        Per-phase timings are logged and kept in last_refresh_stats.
+        """
+        timings = {}
         try:
+            started = time.perf_counter()
             trending = self.scraper.get_trending_products(limit=50)
-            for product_data in trending:
-                self.add_product_to_inventory(product_data)
+            timings['scrape'] = time.perf_counter() - started
+            
+            trending_asins = list({p['asin'] for p in trending if p.get('asin')})
+            if not trending_asins:
+                # Keep the current trending set rather than wiping it on a failed scrape
+                self.last_refresh_stats = {'timings': timings, 'upserted': {}, 'flags_changed': 0}
+                return 0
             
-            # Mark products as trending
-            ProductInventory.query.update({ProductInventory.is_trending: False})
-            for product_data in trending:
-                if product_data.get('asin'):
-                    product = ProductInventory.query.filter_by(asin=product_data['asin']).first()
-                    if product:
-                        product.is_trending = True
+            started = time.perf_counter()
+            counts = self.add_products_to_inventory(trending, commit=False)
+            timings['upsert'] = time.perf_counter() - started
             
+            started = time.perf_counter()
+            now_trending = ProductInventory.asin.in_(trending_asins)
+            result = db.session.execute(
+                update(ProductInventory)
+                .where(func.coalesce(ProductInventory.is_trending, False) != now_trending)
+                .values(is_trending=now_trending, ai_score=ai_score_sql(is_trending=now_trending))
+                .execution_options(synchronize_session=False)
+            )
+            timings['flag'] = time.perf_counter() - started
+            
+            started = time.perf_counter()
             db.session.commit()
+            timings['commit'] = time.perf_counter() - started
+            
+            self.last_refresh_stats = {
+                'timings': timings,
+                'upserted': counts,
+                'flags_changed': result.rowcount
+            }
+            logger.info(
+                "Trending refresh: %d products (%d new), %d flags changed; "
+                "scrape %.3fs, upsert %.3fs, flag %.3fs, commit %.3fs",
+                len(trending_asins), counts['inserted'], result.rowcount,
+                timings['scrape'], timings['upsert'], timings['flag'], timings['commit']
+            )
             return len(trending)
         except Exception as e:
+            db.session.rollback()
             print(f"Error refreshing trending products: {e}")
-            return 0
\ No newline at end of file
+            return 0
+    
+    def refresh_category_products(self, categories=None, limit=20):
+        """Refresh best sellers for several categories (default: all of them)
+
+        The category pages are fetched concurrently, so the crawl takes about
+        as long as the slowest page; everything is then upserted in one
+        transaction. Timings are kept in last_refresh_stats.
+        """
+        timings = {}
+        try:
+            started = time.perf_counter()
+            by_category = self.scraper.get_top_products_for_categories(categories, limit=limit)
+            timings['scrape'] = time.perf_counter() - started
+            
+            products = [
+                dict(product, category=category)
+                for category, category_products in by_category.items()
+                for product in category_products
+            ]
+            
+            started = time.perf_counter()
+            counts = self.add_products_to_inventory(products)
+            timings['upsert'] = time.perf_counter() - started
+            
+            self.last_refresh_stats = {'timings': timings, 'upserted': counts, 'categories': len(by_category)}
+            logger.info(
+                "Category refresh: %d products from %d categories (%d new); scrape %.3fs, upsert %.3fs",
+                len(products), len(by_category), counts['inserted'], timings['scrape'], timings['upsert']
+            )
+            return len(products)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error refreshing category products: {e}")
+            return 0
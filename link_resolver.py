@@ -0,0 +1,125 @@
+"""
+Affiliate Link Resolver - Map short links like amzn.to/44TOVc2 to ASINs
+Follows redirects hop by hop without downloading the product page, and
+remembers each resolution in memory and in the database
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urljoin
+
+from sqlalchemy.exc import IntegrityError
+
+import http_client
+from app import db
+from models import AffiliateLinkResolution
+
+logger = logging.getLogger(__name__)
+
+ASIN_PATTERNS = [
+    re.compile(r'/dp/([A-Z0-9]{10})'),
+    re.compile(r'/gp/product/([A-Z0-9]{10})'),
+]
+
+MAX_REDIRECTS = 6
+MEMORY_CACHE_SIZE = 4096
+
+
+def asin_from_url(url):
+    """Get the ASIN from an Amazon product URL, or None"""
+    for pattern in ASIN_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    return None
+
+
+def normalize_link(link):
+    """Give scheme-less links like amzn.to/xyz a scheme so they can be fetched"""
+    link = link.strip()
+    if not re.match(r'^https?://', link, re.IGNORECASE):
+        link = f"https://{link}"
+    return link
+
+
+def follow_to_asin(link, headers=None):
+    """Follow redirects one hop at a time until a URL carries an ASIN
+
+    Uses HEAD so no body is downloaded. Falls back to a streamed GET (closed
+    before the body is read) for hosts that reject HEAD.
+    """
+    url = normalize_link(link)
+    for _ in range(MAX_REDIRECTS + 1):
+        asin = asin_from_url(url)
+        if asin:
+            return asin
+
+        response = http_client.head(url, headers=headers, allow_redirects=False)
+        if response.status_code in (403, 405, 501):
+            response = http_client.get(url, headers=headers, allow_redirects=False, stream=True)
+            response.close()
+
+        location = response.headers.get('Location')
+        if not response.is_redirect or not location:
+            return asin_from_url(response.url)
+        url = urljoin(url, location)
+
+    logger.warning(f"Gave up resolving {link} after {MAX_REDIRECTS} redirects")
+    return None
+
+
+class AffiliateLinkResolver:
+    def __init__(self, max_entries=MEMORY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, link, headers=None):
+        """Get the ASIN for a link, resolving over the network at most once"""
+        key = normalize_link(link)
+
+        asin = self._memory_get(key)
+        if asin:
+            return asin
+
+        resolution = AffiliateLinkResolution.query.filter_by(short_link=key).first()
+        if resolution:
+            self._memory_put(key, resolution.asin)
+            return resolution.asin
+
+        asin = follow_to_asin(key, headers=headers)
+        if asin:
+            self._save(key, asin)
+            self._memory_put(key, asin)
+        return asin
+
+    def _save(self, key, asin):
+        try:
+            db.session.add(AffiliateLinkResolution(short_link=key, asin=asin))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker resolved the same link first
+            db.session.rollback()
+
+    def _memory_get(self, key):
+        with self._lock:
+            asin = self._memory.get(key)
+            if asin:
+                self._memory.move_to_end(key)
+            return asin
+
+    def _memory_put(self, key, asin):
+        with self._lock:
+            self._memory[key] = asin
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+_resolver = AffiliateLinkResolver()
+
+
+def resolve_asin(link, headers=None):
+    """Get the ASIN behind an affiliate link using the shared resolver"""
+    return _resolver.resolve(link, headers=headers)
@@ -153,6 +153,11 @@ class MultiPlatformPoster:
             from sendgrid import SendGridAPIClient
             from sendgrid.helpers.mail import Mail
             
+            # Tracking pixel, so opens count as impressions of the post
+            pixel = ''
+            if product.get('impression_pixel_url'):
+                pixel = f'<img src="{product["impression_pixel_url"]}" width="1" height="1" alt="" style="display: block;">'
+
             html_content = f"""
             <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
                 <h2 style="color: #333;">🛍️ {product['title']}</h2>
@@ -176,6 +181,7 @@ class MultiPlatformPoster:
                 <p style="margin-top: 30px; font-size: 12px; color: #888;">
                     This is an affiliate link. We may earn a commission from qualifying purchases.
                 </p>
+                {pixel}
             </div>
             """
             
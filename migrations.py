@@ -0,0 +1,164 @@
+"""
+Schema Migrations - Bring existing databases up to date with models.py
+db.create_all() only creates missing tables, so indexes and columns added to
+existing tables are applied here, in order, once per database
+"""
+import logging
+from contextlib import contextmanager
+
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import Post, ProductInventory, SchemaMigration, WebhookDestination
+from pricing import parse_price
+from scoring import refresh_ai_scores
+import rollups
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key held while migrations run (any constant shared by all workers)
+MIGRATION_LOCK_KEY = 3_000_000_001
+
+
+def _create_missing_indexes(model, *names):
+    """Create the named indexes declared on a model if the database lacks them"""
+    for index in model.__table__.indexes:
+        if index.name in names:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def _add_missing_columns(model, *names):
+    """ALTER TABLE ADD COLUMN for declared columns the database lacks"""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    with db.engine.begin() as conn:
+        for name in names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect=db.engine.dialect)}'
+            if column.server_default is not None:
+                ddl += f' DEFAULT {column.server_default.arg}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+            conn.exec_driver_sql(ddl)
+
+
+def _backfill(model, source, targets, compute, batch_size=1000):
+    """Fill target columns from a source column in id-ordered batches
+
+    compute(value) returns a tuple matching targets. Only rows whose first
+    target is still NULL are touched, so an interrupted backfill resumes.
+    """
+    table = model.__table__
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c[source])
+            .where(table.c.id > last_id, table.c[source].isnot(None), table.c[targets[0]].is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for row_id, value in rows:
+            computed = compute(value)
+            params.append({'row_id': row_id, **{f'new_{t}': v for t, v in zip(targets, computed)}})
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('row_id'))
+            .values({t: bindparam(f'new_{t}') for t in targets})
+            .execution_options(synchronize_session=False),
+            params,
+        )
+        db.session.commit()
+        last_id = rows[-1][0]
+
+
+def add_hot_query_indexes():
+    """Composite and partial indexes for the dashboard and selector queries"""
+    _create_missing_indexes(Post, 'ix_posts_user_created', 'ix_posts_asin')
+    _create_missing_indexes(
+        ProductInventory,
+        'ix_product_inventory_active_category',
+        'ix_product_inventory_active_conversion',
+    )
+    _create_missing_indexes(WebhookDestination, 'ix_webhook_destinations_user_active')
+
+
+def add_price_cents():
+    """Numeric price columns, backfilled from the free-form price strings"""
+    for model in (Post, ProductInventory):
+        _add_missing_columns(model, 'price_cents', 'currency')
+        _backfill(model, 'price', ('price_cents', 'currency'), parse_price)
+    _create_missing_indexes(ProductInventory, 'ix_product_inventory_active_price')
+
+
+def add_ai_score():
+    """Stored AI score, computed for every existing product"""
+    _add_missing_columns(ProductInventory, 'ai_score')
+    refresh_ai_scores(commit=True)
+    _create_missing_indexes(ProductInventory, 'ix_product_inventory_active_score')
+
+
+def add_recent_promotion_index():
+    """Index for excluding products a user promoted recently"""
+    _create_missing_indexes(Post, 'ix_posts_user_asin_created')
+
+
+def add_post_daily_stats():
+    """Backfill the analytics rollup (the table itself comes from create_all)"""
+    rollups.rebuild()
+
+
+# (version, function) in the order they must run; never reorder or rename
+MIGRATIONS = [
+    ('0001_hot_query_indexes', add_hot_query_indexes),
+    ('0002_price_cents', add_price_cents),
+    ('0003_ai_score', add_ai_score),
+    ('0004_recent_promotion_index', add_recent_promotion_index),
+    ('0005_post_daily_stats', add_post_daily_stats),
+]
+
+
+@contextmanager
+def _migration_lock():
+    """Hold a database-wide lock so only one worker migrates at a time
+
+    PostgreSQL uses a session advisory lock on a connection of its own, so it
+    is held across the migration commits. SQLite already serializes writers.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        yield
+        return
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+
+def run_migrations():
+    """Apply every migration this database hasn't recorded yet
+
+    Workers starting at the same time wait on a lock and re-read what has
+    been applied once they hold it, so each step runs once (steps such as the
+    rollup rebuild are not safe to run concurrently).
+    """
+    with _migration_lock():
+        db.session.rollback()  # see migrations committed while we waited
+        applied = {row.version for row in SchemaMigration.query.all()}
+        for version, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Applying migration {version}")
+            migrate()
+            try:
+                db.session.add(SchemaMigration(version=version))
+                db.session.commit()
+            except IntegrityError:
+                # Another worker recorded it first
+                db.session.rollback()
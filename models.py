@@ -2,7 +2,10 @@ from datetime import datetime
 from app import db
 from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
 from flask_login import UserMixin
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, event, inspect
+from sqlalchemy.orm import validates
+from pricing import parse_price
+from scoring import SCORE_INPUTS, calculate_ai_score
 
 # User authentication tables (required for Replit Auth)
 class User(UserMixin, db.Model):
@@ -85,6 +88,8 @@ class Post(db.Model):
     amazon_url = db.Column(db.String(500), nullable=False)
     affiliate_url = db.Column(db.String(500), nullable=False)
     price = db.Column(db.String(20))
+    price_cents = db.Column(db.Integer, nullable=True)  # parsed from price at ingest
+    currency = db.Column(db.String(3), nullable=True)
     rating = db.Column(db.Float)
     category = db.Column(db.String(50))
     
@@ -113,9 +118,95 @@ class Post(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.now)
     
+    __table_args__ = (
+        # Per-user time windows: dashboard, can_user_post, analytics, recent promotions
+        db.Index('ix_posts_user_created', 'user_id', 'created_at'),
+        # "Has this user promoted this product lately?" anti-joins
+        db.Index('ix_posts_user_asin_created', 'user_id', 'asin', 'created_at'),
+        # Manually posted products often have no ASIN, so leave those out
+        db.Index(
+            'ix_posts_asin', 'asin',
+            postgresql_where=db.text('asin IS NOT NULL'),
+            sqlite_where=db.text('asin IS NOT NULL'),
+        ),
+    )
+    
+    @validates('price')
+    def _parse_price(self, key, price):
+        self.price_cents, self.currency = parse_price(price)
+        return price
+    
     def __repr__(self):
         return f'<Post {self.product_title}>'
 
+@event.listens_for(Post, 'after_insert')
+def _roll_up_new_post(mapper, connection, post):
+    import rollups
+    rollups.post_inserted(post, connection)
+
+@event.listens_for(Post, 'before_update')
+def _roll_up_changed_post(mapper, connection, post):
+    import rollups
+    rollups.post_updating(post, connection)
+
+@event.listens_for(Post, 'before_delete')
+def _roll_up_deleted_post(mapper, connection, post):
+    import rollups
+    rollups.post_deleting(post, connection)
+
+# Per-day post totals for analytics, maintained alongside posts (see rollups.py).
+# platform is 'all' for totals, or one platform for that platform's share.
+class PostDailyStat(db.Model):
+    __tablename__ = 'post_daily_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)  # the posts' created_at date
+    platform = db.Column(db.String(20), nullable=False)
+    category = db.Column(db.String(50), nullable=False, default='')
+    
+    posts = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    impressions = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    conversion_rate_sum = db.Column(db.Float, nullable=False, default=0.0)
+    
+    __table_args__ = (
+        UniqueConstraint('user_id', 'day', 'platform', 'category', name='uq_post_daily_stats_key'),
+    )
+
+# One row per affiliate click, written in batches by click_events.py. Rows
+# older than the retention window are folded into click_daily_stats.
+class ClickEvent(db.Model):
+    __tablename__ = 'click_events'
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, nullable=False)  # no FK: a deleted post mustn't fail a whole batch
+    ts = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    referrer_hash = db.Column(db.String(16), nullable=True)  # keyed hash of the referring host
+    ua_class = db.Column(db.String(20), nullable=False, default='unknown')
+    ip_hash = db.Column(db.String(16), nullable=True)  # keyed hash, never the address
+    
+    __table_args__ = (
+        db.Index('ix_click_events_post_ts', 'post_id', 'ts'),
+        db.Index('ix_click_events_ts', 'ts'),
+    )
+
+# Clicks by the hour they happened, for events past the click_events retention
+class ClickDailyStat(db.Model):
+    __tablename__ = 'click_daily_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    referrer_hash = db.Column(db.String(16), nullable=False, default='')
+    ua_class = db.Column(db.String(20), nullable=False)
+    
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    unique_visitors = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint('user_id', 'day', 'hour', 'referrer_hash', 'ua_class', name='uq_click_daily_stats_key'),
+    )
+
 # Email blast campaigns for admin
 class EmailBlast(db.Model):
     __tablename__ = 'email_blasts'
@@ -145,6 +236,8 @@ class ProductInventory(db.Model):
     product_title = db.Column(db.String(200), nullable=False)
     category = db.Column(db.String(50))
     price = db.Column(db.String(20))
+    price_cents = db.Column(db.Integer, nullable=True)  # parsed from price at ingest
+    currency = db.Column(db.String(3), nullable=True)
     rating = db.Column(db.Float)
     image_url = db.Column(db.String(500))
     
@@ -158,8 +251,52 @@ class ProductInventory(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     is_trending = db.Column(db.Boolean, default=False)
     
+    # Precomputed scoring.calculate_ai_score, refreshed whenever an input changes
+    ai_score = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        # Active catalog browsing and AI recommendations by category
+        db.Index('ix_product_inventory_active_category', 'is_active', 'category'),
+        # get_products_to_promote: active products by conversion rate
+        db.Index('ix_product_inventory_active_conversion', 'is_active', 'conversion_rate'),
+        # Price-band filters and sorting
+        db.Index('ix_product_inventory_active_price', 'is_active', 'price_cents'),
+        # AI recommendations: ORDER BY ai_score DESC LIMIT n
+        db.Index('ix_product_inventory_active_score', 'is_active', 'ai_score'),
+    )
+    
+    @validates('price')
+    def _parse_price(self, key, price):
+        self.price_cents, self.currency = parse_price(price)
+        return price
+
+@event.listens_for(ProductInventory, 'before_insert')
+def _score_new_product(mapper, connection, product):
+    product.ai_score = calculate_ai_score(product)
+
+@event.listens_for(ProductInventory, 'before_update')
+def _rescore_changed_product(mapper, connection, product):
+    state = inspect(product)
+    if any(state.attrs[name].history.has_changes() for name in SCORE_INPUTS):
+        product.ai_score = calculate_ai_score(product)
+
+# Resolved affiliate short links (amzn.to/... -> ASIN), shared by all workers
+class AffiliateLinkResolution(db.Model):
+    __tablename__ = 'affiliate_link_resolutions'
+    id = db.Column(db.Integer, primary_key=True)
+    short_link = db.Column(db.String(500), unique=True, nullable=False)
+    asin = db.Column(db.String(20), nullable=False)
+
+    resolved_at = db.Column(db.DateTime, default=datetime.now)
+
+# Applied schema migrations (see migrations.py)
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
 
 # Multiple webhook destinations
 class WebhookDestination(db.Model):
@@ -180,4 +317,8 @@ class WebhookDestination(db.Model):
     last_test_time = db.Column(db.DateTime, nullable=True)
     last_test_success = db.Column(db.Boolean, default=False)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        db.Index('ix_webhook_destinations_user_active', 'user_id', 'is_active'),
+    )
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Price Parsing - Turn scraped price strings into integer cents once, at ingest
+"""
+import re
+
+CURRENCY_SYMBOLS = {
+    '$': 'USD',
+    '£': 'GBP',
+    '€': 'EUR',
+    '¥': 'JPY',
+    '₹': 'INR',
+}
+
+_CODE_PATTERN = re.compile(r'\b(USD|CAD|AUD|GBP|EUR|JPY|INR|MXN)\b', re.IGNORECASE)
+_NUMBER_PATTERN = re.compile(r'\d[\d.,\s]*')
+
+
+def parse_price(text, default_currency='USD'):
+    """Parse a price like "$1,299.99" into (cents, currency)
+
+    Returns (None, None) for text without a number, such as
+    "Price not available". Decimal commas ("12,50 €", "1.299,00 €") are
+    recognised.
+    """
+    if not text:
+        return None, None
+
+    number = _NUMBER_PATTERN.search(text)
+    if not number:
+        return None, None
+    digits = re.sub(r'\s', '', number.group()).rstrip('.,')
+
+    # Whichever separator comes last is the decimal point, unless it's a
+    # lone comma that isn't followed by exactly two digits ("1,299")
+    if ',' in digits and (digits.rfind(',') > digits.rfind('.')):
+        if '.' in digits or re.search(r',\d{2}$', digits):
+            digits = digits.replace('.', '').replace(',', '.')
+        else:
+            digits = digits.replace(',', '')
+    else:
+        digits = digits.replace(',', '')
+    if digits.count('.') > 1:
+        whole, _, fraction = digits.rpartition('.')
+        digits = whole.replace('.', '') + '.' + fraction
+
+    try:
+        cents = int(round(float(digits) * 100))
+    except ValueError:
+        return None, None
+
+    currency = default_currency
+    code = _CODE_PATTERN.search(text)
+    if code:
+        currency = code.group(1).upper()
+    else:
+        for symbol, symbol_currency in CURRENCY_SYMBOLS.items():
+            if symbol in text:
+                currency = symbol_currency
+                break
+
+    return cents, currency
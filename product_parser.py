@@ -0,0 +1,94 @@
+"""
+Fast Product Page Parser
+Incremental lxml parsing that only builds the product containers we need
+"""
+from bs4 import BeautifulSoup
+from lxml import etree
+
+# Bytes handed to the incremental parser per step; small enough that we stop
+# soon after the last wanted container closes
+CHUNK_SIZE = 64 * 1024
+
+
+def is_bestseller_container(element):
+    """Match a product card on a best-sellers page"""
+    return element.tag == 'div' and 'zg-grid-general-faceout' in (element.get('class') or '')
+
+
+def is_search_result_container(element):
+    """Match a product card on a search results page"""
+    return element.tag == 'div' and element.get('data-component-type') == 's-search-result'
+
+
+def _to_soup(element):
+    """Turn a finished lxml container into a BeautifulSoup tag for the extractors"""
+    fragment = etree.tostring(element, method='html', encoding='unicode', with_tail=False)
+    return BeautifulSoup(fragment, 'lxml').find(element.tag)
+
+
+def _release(element):
+    """Drop an element's subtree and any finished siblings before it"""
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def iter_product_containers(content, match, limit=None, encoding=None, chunk_size=CHUNK_SIZE):
+    """Yield matching containers as BeautifulSoup tags, in document order
+
+    The page is fed to lxml in chunks and everything outside a matching
+    container is discarded as soon as it closes, so memory stays flat.
+    Parsing stops once ``limit`` containers have been yielded. ``encoding``
+    is the charset the response headers declared; without one lxml uses the
+    page's <meta charset>.
+    """
+    if isinstance(content, str):
+        encoding = encoding or 'utf-8'
+        content = content.encode(encoding)
+
+    parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+    depth = 0  # > 0 while inside a matching container
+    found = 0
+
+    def process_events():
+        nonlocal depth, found
+        for event, element in parser.read_events():
+            if event == 'start':
+                if depth:
+                    depth += 1
+                elif match(element):
+                    depth = 1
+                continue
+
+            if not depth:
+                _release(element)
+                continue
+
+            depth -= 1
+            if depth == 0:
+                yield _to_soup(element)
+                found += 1
+                _release(element)
+                if limit and found >= limit:
+                    return
+
+    for offset in range(0, len(content), chunk_size):
+        parser.feed(content[offset:offset + chunk_size])
+        yield from process_events()
+        if limit and found >= limit:
+            return
+
+    parser.close()
+    yield from process_events()
+
+
+def find_bestseller_containers(content, limit=None, encoding=None):
+    """Get product containers from a best-sellers page"""
+    return list(iter_product_containers(content, is_bestseller_container, limit, encoding))
+
+
+def find_search_result_containers(content, limit=None, encoding=None):
+    """Get product containers from a search results page"""
+    return list(iter_product_containers(content, is_search_result_container, limit, encoding))
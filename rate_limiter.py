@@ -0,0 +1,123 @@
+"""
+Rate Limiter - Per-host token buckets shared across worker processes
+Bucket state lives in a small SQLite file so every gunicorn worker draws
+from the same budget. Callers only wait when the bucket is empty.
+"""
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = os.environ.get(
+    'RATE_LIMIT_DB',
+    os.path.join(tempfile.gettempdir(), 'affiliatebot_rate_limits.sqlite3'),
+)
+
+# host -> (tokens refilled per second, bucket capacity)
+HOST_LIMITS = {
+    'www.amazon.com': (float(os.environ.get('AMAZON_REQUESTS_PER_SECOND', 2)), 8),
+    'amazon.com': (float(os.environ.get('AMAZON_REQUESTS_PER_SECOND', 2)), 8),
+    'amzn.to': (5.0, 10),
+}
+
+# Random extra delay added when a caller does have to wait, so queued
+# requests don't all fire on the same tick
+MAX_JITTER = 0.25
+
+# Longer waits than this fail fast instead of tying up a web worker
+MAX_WAIT = 10.0
+
+
+class RateLimitExceeded(requests.RequestException):
+    """The wait for a token would be longer than the caller allows"""
+
+
+class TokenBucketLimiter:
+    def __init__(self, path=STATE_PATH, limits=None, max_wait=MAX_WAIT, max_jitter=MAX_JITTER):
+        self.path = path
+        self.limits = HOST_LIMITS if limits is None else limits
+        self.max_wait = max_wait
+        self.max_jitter = max_jitter
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'host TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, host, max_wait=None):
+        """Take a token for host and return how long to wait before using it"""
+        if host not in self.limits:
+            return 0.0
+        rate, capacity = self.limits[host]
+        max_wait = self.max_wait if max_wait is None else max_wait
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE host = ?', (host,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+            # Tokens may go negative: that reserves a slot in the queue
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if wait > max_wait:
+                conn.execute('ROLLBACK')
+                raise RateLimitExceeded(f"Rate limit for {host} needs a {wait:.1f}s wait")
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (host, tokens, updated_at) VALUES (?, ?, ?)',
+                (host, tokens - 1, now),
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire(self, host, max_wait=None):
+        """Block only if host's bucket is empty; returns seconds waited"""
+        try:
+            wait = self.reserve(host, max_wait)
+        except sqlite3.Error as e:
+            # Never let the limiter's own storage take the scraper down
+            logger.warning(f"Rate limiter unavailable, not limiting {host}: {e}")
+            return 0.0
+
+        if wait > 0:
+            wait += random.uniform(0, self.max_jitter)
+            time.sleep(wait)
+        return wait
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Get the process-wide limiter"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = TokenBucketLimiter()
+    return _limiter
+
+
+def acquire(host, max_wait=None):
+    """Wait for a request slot to host using the shared limiter"""
+    return get_limiter().acquire(host, max_wait)
@@ -0,0 +1,376 @@
+"""
+Response Cache - TTL cache in front of scraped Amazon page fetches
+In-memory LRU bounded by bytes, optional on-disk store bounded by age and
+bytes, ETag/Last-Modified revalidation and stale-while-revalidate
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import http_client
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR')  # unset = memory only
+DEFAULT_TTL = 300
+
+# Seconds a page stays fresh, first matching pattern wins
+TTL_RULES = [
+    (re.compile(r'/zgbs/'), 900),                       # best-sellers lists
+    (re.compile(r'^https://www\.amazon\.com/?$'), 600),  # homepage (trending)
+    (re.compile(r'/s\?'), 300),                         # search results
+]
+
+# How long past expiry a stale page may be served while it revalidates
+STALE_WHILE_REVALIDATE = int(os.environ.get('RESPONSE_CACHE_STALE_SECONDS', 3600))
+
+# On-disk store limits: files past this age are deleted, and the oldest go
+# first once the directory grows past DISK_MAX_BYTES
+DISK_MAX_AGE = int(os.environ.get('RESPONSE_CACHE_DISK_MAX_AGE', 24 * 3600))
+DISK_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_DISK_MAX_BYTES', 256 * 1024 * 1024))
+# Least time between sweeps of the cache directory
+DISK_PRUNE_INTERVAL = 300
+
+
+def ttl_for_url(url):
+    """Get the freshness lifetime for a URL"""
+    for pattern, ttl in TTL_RULES:
+        if pattern.search(url):
+            return ttl
+    return DEFAULT_TTL
+
+
+class CachedResponse:
+    """The parts of a requests.Response the scrapers use"""
+
+    def __init__(self, url, status_code, content, encoding=None, etag=None,
+                 last_modified=None, stored_at=None, ttl=DEFAULT_TTL, content_type=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at if stored_at is not None else time.time()
+        self.ttl = ttl
+
+    @property
+    def headers(self):
+        return {'Content-Type': self.content_type} if self.content_type else {}
+
+    @property
+    def size(self):
+        return len(self.content)
+
+    def age(self, now=None):
+        return (now or time.time()) - self.stored_at
+
+    def raise_for_status(self):
+        """Only 200 responses are cached, so there is nothing to raise"""
+        return None
+
+    @classmethod
+    def from_response(cls, response, ttl):
+        return cls(
+            url=response.url,
+            status_code=response.status_code,
+            content=response.content,
+            encoding=response.encoding,
+            content_type=response.headers.get('Content-Type'),
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            ttl=ttl,
+        )
+
+    def to_json(self):
+        return json.dumps({
+            'url': self.url,
+            'status_code': self.status_code,
+            'content': base64.b64encode(self.content).decode('ascii'),
+            'encoding': self.encoding,
+            'content_type': self.content_type,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'stored_at': self.stored_at,
+            'ttl': self.ttl,
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        fields = json.loads(data)
+        fields['content'] = base64.b64decode(fields['content'])
+        return cls(**fields)
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=MAX_BYTES, cache_dir=CACHE_DIR, stale_seconds=STALE_WHILE_REVALIDATE,
+                 disk_max_bytes=DISK_MAX_BYTES, disk_max_age=DISK_MAX_AGE):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.stale_seconds = stale_seconds
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_age = disk_max_age
+        self._pruned_at = 0.0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='response-cache')
+        self.stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'refreshed': 0,
+            'evictions': 0,
+            'disk_hits': 0,
+            'disk_pruned': 0,
+        }
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, url, headers=None, ttl=None, **kwargs):
+        """Get a page, serving from cache when fresh or revalidating when stale"""
+        ttl = ttl if ttl is not None else ttl_for_url(url)
+        entry = self._lookup(url)
+
+        if entry is None:
+            self._count('misses')
+            return self._fetch(url, headers, ttl, None, **kwargs)
+
+        age = entry.age()
+        if age < entry.ttl:
+            self._count('hits')
+            return entry
+
+        if age < entry.ttl + self.stale_seconds:
+            self._count('stale_hits')
+            self._revalidate_in_background(url, headers, ttl, entry, **kwargs)
+            return entry
+
+        self._count('misses')
+        return self._fetch(url, headers, ttl, entry, **kwargs)
+
+    def invalidate(self, url):
+        """Drop a URL from memory and disk"""
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry:
+                self._bytes -= entry.size
+        path = self._disk_path(url)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def get_stats(self):
+        """Get hit/miss counters and current size"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _fetch(self, url, headers, ttl, entry, **kwargs):
+        """Fetch from Amazon, conditionally if we hold a previous copy"""
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.etag:
+                request_headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                request_headers['If-Modified-Since'] = entry.last_modified
+
+        response = http_client.get(url, headers=request_headers, **kwargs)
+
+        if entry is not None and response.status_code == 304:
+            self._count('revalidated')
+            refreshed = CachedResponse(
+                url=entry.url,
+                status_code=entry.status_code,
+                content=entry.content,
+                encoding=entry.encoding,
+                content_type=entry.content_type,
+                etag=response.headers.get('ETag', entry.etag),
+                last_modified=response.headers.get('Last-Modified', entry.last_modified),
+                ttl=ttl,
+            )
+            self._store(url, refreshed)
+            return refreshed
+
+        if response.status_code == 200:
+            if entry is not None:
+                self._count('refreshed')
+            cached = CachedResponse.from_response(response, ttl)
+            self._store(url, cached)
+            return cached
+
+        return response
+
+    def _revalidate_in_background(self, url, headers, ttl, entry, **kwargs):
+        with self._lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+
+        def revalidate():
+            try:
+                self._fetch(url, headers, ttl, entry, **kwargs)
+            except requests.RequestException as e:
+                logger.warning(f"Background revalidation failed for {url}: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(url)
+
+        self._executor.submit(revalidate)
+
+    def _lookup(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+
+        entry = self._read_disk(url)
+        if entry is not None:
+            self._count('disk_hits')
+            self._store_memory(url, entry)
+        return entry
+
+    def _store(self, url, entry):
+        self._store_memory(url, entry)
+        self._write_disk(url, entry)
+
+    def _store_memory(self, url, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous:
+                self._bytes -= previous.size
+            self._entries[url] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.stats['evictions'] += 1
+
+    def _disk_path(self, url):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_disk(self, url):
+        path = self._disk_path(url)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return CachedResponse.from_json(f.read())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Discarding unreadable cache file {path}: {e}")
+            return None
+
+    def _write_disk(self, url, entry):
+        path = self._disk_path(url)
+        if not path:
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(entry.to_json())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache file {path}: {e}")
+
+        with self._lock:
+            due = time.monotonic() - self._pruned_at >= DISK_PRUNE_INTERVAL
+            if due:
+                self._pruned_at = time.monotonic()
+        if due:
+            self._executor.submit(self.prune_disk)
+
+    def prune_disk(self):
+        """Delete expired cache files, then the oldest until under disk_max_bytes
+
+        Runs in the background at most every DISK_PRUNE_INTERVAL seconds after
+        a write; safe with several workers sharing the directory. Returns the
+        number of files deleted.
+        """
+        if not self.cache_dir:
+            return 0
+        cutoff = time.time() - self.disk_max_age
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(('.json', '.tmp')):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            logger.warning(f"Could not scan cache directory {self.cache_dir}: {e}")
+            return 0
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass  # another worker got there first
+            except OSError as e:
+                logger.warning(f"Could not delete cache file {path}: {e}")
+                continue
+            total -= size
+
+        if removed:
+            with self._lock:
+                self.stats['disk_pruned'] += removed
+            logger.info(f"Pruned {removed} response cache files from {self.cache_dir}")
+        return removed
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Get the process-wide response cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
+
+
+def cached_get(url, headers=None, ttl=None, **kwargs):
+    """GET a page through the shared response cache"""
+    return get_cache().get(url, headers=headers, ttl=ttl, **kwargs)
+
+
+def get_cache_stats():
+    """Get the shared cache's hit/miss counters"""
+    return get_cache().get_stats()
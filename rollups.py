@@ -0,0 +1,201 @@
+"""
+Analytics Rollups - Keep post_daily_stats in step with posts
+Every post contributes to one 'all' row and one row per platform it went to,
+keyed by (user, created_at date, platform, category). Inserts, ORM updates
+and deletes of posts are applied by mapper events in models.py; bulk counter
+updates call add_to_posts(). Clicks and revenue count towards the day the
+post was created, so the rollup matches summing the posts themselves.
+
+Usage:
+    python rollups.py [--user USER_ID]    # rebuild from the posts table
+"""
+import argparse
+from collections import defaultdict
+
+from sqlalchemy import func, inspect, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import app, db
+
+ALL_PLATFORMS = 'all'
+
+# Platform name -> Post flag recording a post went there
+PLATFORM_FLAGS = {
+    'discord': 'posted_to_discord',
+    'telegram': 'posted_to_telegram',
+    'slack': 'posted_to_slack',
+    'email': 'posted_to_email',
+}
+
+# Rollup column -> the Post column it sums
+METRICS = {
+    'clicks': 'clicks',
+    'impressions': 'impressions',
+    'revenue': 'revenue_estimated',
+    'conversion_rate_sum': 'conversion_rate',
+}
+
+# Post columns that decide which rows a post lands in, or what it adds
+POST_ROLLUP_INPUTS = ('user_id', 'created_at', 'category', *PLATFORM_FLAGS.values(), *METRICS.values())
+
+
+def _keys(row):
+    """Rollup keys a post row contributes to"""
+    day = row['created_at'].date()
+    category = row['category'] or ''
+    keys = [(row['user_id'], day, ALL_PLATFORMS, category)]
+    keys += [(row['user_id'], day, platform, category)
+             for platform, flag in PLATFORM_FLAGS.items() if row[flag]]
+    return keys
+
+
+def _contribution(row, sign=1):
+    """{key: {column: amount}} a post row adds to the rollup"""
+    amounts = {'posts': sign}
+    for column, post_column in METRICS.items():
+        amounts[column] = sign * (row[post_column] or 0)
+    return {key: dict(amounts) for key in _keys(row)}
+
+
+def _merge(*contributions):
+    merged = defaultdict(lambda: defaultdict(int))
+    for contribution in contributions:
+        for key, amounts in contribution.items():
+            for column, amount in amounts.items():
+                merged[key][column] += amount
+    return merged
+
+
+def _stored_post(connection, post_id):
+    """The rollup inputs of a post as currently stored"""
+    from models import Post
+
+    columns = [Post.__table__.c[name] for name in POST_ROLLUP_INPUTS]
+    row = connection.execute(select(*columns).where(Post.id == post_id)).one()
+    return dict(zip(POST_ROLLUP_INPUTS, row))
+
+
+def apply(deltas, bind=None):
+    """Add {key: {column: amount}} to the rollup with one upsert"""
+    from models import PostDailyStat
+
+    rows = []
+    for (user_id, day, platform, category), amounts in deltas.items():
+        if any(amounts.values()):
+            rows.append({
+                'user_id': user_id, 'day': day, 'platform': platform, 'category': category,
+                'posts': 0, 'clicks': 0, 'impressions': 0, 'revenue': 0.0, 'conversion_rate_sum': 0.0,
+                **amounts,
+            })
+    if not rows:
+        return
+
+    bind = bind if bind is not None else db.session
+    # app.py only starts on PostgreSQL or SQLite
+    dialect = (bind.get_bind() if bind is db.session else bind).dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    table = PostDailyStat.__table__
+    stmt = insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day, table.c.platform, table.c.category],
+        set_={column: table.c[column] + stmt.excluded[column]
+              for column in ('posts', *METRICS)}
+    )
+    bind.execute(stmt)
+
+
+def post_inserted(post, connection):
+    row = {name: getattr(post, name) for name in POST_ROLLUP_INPUTS}
+    apply(_contribution(row), bind=connection)
+
+
+def post_updating(post, connection):
+    """Move a post's contribution before its UPDATE is written
+
+    The stored row is read rather than attribute history, which is empty for
+    attributes that were expired when they were set.
+    """
+    state = inspect(post)
+    changed = [name for name in POST_ROLLUP_INPUTS if state.attrs[name].history.has_changes()]
+    if not changed:
+        return
+    old = _stored_post(connection, post.id)
+    new = dict(old, **{name: state.attrs[name].value for name in changed})
+    apply(_merge(_contribution(old, sign=-1), _contribution(new)), bind=connection)
+
+
+def post_deleting(post, connection):
+    apply(_contribution(_stored_post(connection, post.id), sign=-1), bind=connection)
+
+
+def add_to_posts(column, post_counts, bind=None):
+    """Roll up a bulk increment of a Post metric column, e.g. clicks
+
+    post_counts is {post_id: n}; call it in the same transaction as the
+    UPDATE of the posts themselves.
+    """
+    from models import Post
+
+    if not post_counts:
+        return
+    rollup_column = next(name for name, post_column in METRICS.items() if post_column == column)
+    bind = bind if bind is not None else db.session
+    names = ('id', 'user_id', 'created_at', 'category', *PLATFORM_FLAGS.values())
+    posts = bind.execute(
+        select(*[Post.__table__.c[name] for name in names]).where(Post.id.in_(list(post_counts)))
+    ).all()
+    deltas = _merge(*[
+        {key: {rollup_column: post_counts[row.id]} for key in _keys(row._mapping)}
+        for row in posts
+    ])
+    apply(deltas, bind=bind)
+
+
+def rebuild(user_id=None, commit=True):
+    """Recompute the rollup from the posts table (for one user, or everyone)
+
+    Runs as DELETE plus one INSERT ... SELECT per platform in a single
+    transaction; run it while posts aren't being written.
+    """
+    from models import Post, PostDailyStat
+
+    table = PostDailyStat.__table__
+    delete = table.delete()
+    if user_id is not None:
+        delete = delete.where(table.c.user_id == user_id)
+    db.session.execute(delete)
+
+    day = func.date(Post.created_at)
+    category = func.coalesce(Post.category, '')
+    for platform in (ALL_PLATFORMS, *PLATFORM_FLAGS):
+        query = select(
+            Post.user_id, day, literal(platform), category,
+            func.count(Post.id),
+            *[func.coalesce(func.sum(Post.__table__.c[column]), 0) for column in METRICS.values()]
+        ).where(Post.created_at.isnot(None))
+        if platform != ALL_PLATFORMS:
+            query = query.where(Post.__table__.c[PLATFORM_FLAGS[platform]] == True)
+        if user_id is not None:
+            query = query.where(Post.user_id == user_id)
+        db.session.execute(table.insert().from_select(
+            ['user_id', 'day', 'platform', 'category', 'posts', *METRICS],
+            query.group_by(Post.user_id, day, category)
+        ))
+
+    if commit:
+        db.session.commit()
+    return db.session.query(func.count(PostDailyStat.id)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild post_daily_stats from the posts table')
+    parser.add_argument('--user', help='only rebuild this user id')
+    args = parser.parse_args()
+
+    with app.app_context():
+        rows = rebuild(args.user)
+        print(f"post_daily_stats rebuilt: {rows} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, abort
 from flask_login import current_user, login_required
 from app import app, db
 from models import User, Campaign, Post, EmailBlast
@@ -22,6 +22,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Largest view count one platform report may add to a post
+MAX_REPORTED_IMPRESSIONS = 10_000_000
+
 # Register authentication blueprint (only if available)
 replit_bp = make_replit_blueprint()
 if replit_bp:
@@ -215,6 +218,14 @@ def post_product():
             rating=product_data['rating'],
             category=product_data['category']
         )
+        # Saved before sending so the tracked links work as soon as they land
+        db.session.add(post)
+        db.session.commit()
+        
+        # Post the tracked link (clicks, and unfurl fetches as impressions)
+        # and give email a pixel for opens
+        product_data['affiliate_url'] = url_for('track_click', post_id=post.id, _external=True)
+        product_data['impression_pixel_url'] = url_for('impression_pixel', post_id=post.id, _external=True)
         
         # Post to platforms
         poster = MultiPlatformPoster(user)
@@ -226,7 +237,6 @@ def post_product():
         post.posted_to_slack = results.get('slack', False)
         post.posted_to_email = results.get('email', False)
         
-        db.session.add(post)
         db.session.commit()
         
         successful_platforms = sum(results.values())
@@ -451,14 +461,100 @@ def admin_subscription_settings():
     # This is where you can set up pricing tiers, posting frequency limits, etc.
     return render_template('admin/subscription_settings.html')
 
+@app.route('/admin/scraper-stats')
+@require_login
+def admin_scraper_stats():
+    """Connection pool and page cache counters for tuning the scraper"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'error': 'Admin only'}), 403
+
+    import http_client
+    import response_cache
+
+    return jsonify({
+        'success': True,
+        'connections': http_client.get_connection_stats(),
+        'page_cache': response_cache.get_cache_stats()
+    })
+
+@app.route('/admin/click-stats')
+@require_login
+def admin_click_stats():
+    """Write-behind click and impression buffer depth and flush lag for this worker"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'error': 'Admin only'}), 403
+
+    import click_buffer
+    import click_events
+    import click_filter
+    import click_redirect
+
+    return jsonify({
+        'success': True,
+        'worker_pid': os.getpid(),
+        'clicks': click_buffer.get_click_stats(),
+        'impressions': click_buffer.get_impression_stats(),
+        'redirect_cache': click_redirect.get_redirect_cache_stats(),
+        'click_events': click_events.get_click_event_stats(),
+        'click_filter': click_filter.get_filter_stats()
+    })
+
 @app.route('/api/track-click/<int:post_id>')
 def track_click(post_id):
-    """Track clicks on affiliate links"""
-    post = Post.query.get_or_404(post_id)
-    post.clicks += 1
-    db.session.commit()
+    """Track clicks on affiliate links
+    
+    Normally answered by ClickRedirectMiddleware before reaching Flask; this
+    route stays for url_for() and for apps without the middleware, and counts
+    through the same click_redirect.handle_click().
+    """
+    import click_redirect
+    
+    affiliate_url = click_redirect.lookup_affiliate_url(post_id)
+    if affiliate_url is None:
+        abort(404)
+    click_redirect.handle_click(post_id, request.environ)
+    return redirect(affiliate_url)
+
+@app.route('/api/impression/<int:post_id>.gif')
+def impression_pixel(post_id):
+    """Tracking pixel for post impressions (email opens, embedded images)
+    
+    Normally answered by ClickRedirectMiddleware; always returns the pixel so
+    a missing post doesn't show a broken image.
+    """
+    import click_redirect
+    
+    click_redirect.handle_impression(post_id, request.environ)
+    return click_redirect.PIXEL_GIF, 200, {'Content-Type': 'image/gif', 'Cache-Control': 'no-store'}
+
+@app.route('/api/posts/<int:post_id>/impressions', methods=['POST'])
+@require_login
+def report_post_impressions(post_id):
+    """Add impressions a platform reported for a post, e.g. view counts
+    
+    Body: {"impressions": n}, the views since the last report, at most
+    MAX_REPORTED_IMPRESSIONS.
+    """
+    import click_buffer
+    
+    post = Post.query.filter_by(id=post_id, user_id=current_user.id).first()
+    if not post:
+        return jsonify({'success': False, 'error': 'Post not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        impressions = int(data.get('impressions', 0))
+    except (TypeError, ValueError):
+        impressions = -1
+    if not 0 <= impressions <= MAX_REPORTED_IMPRESSIONS:
+        return jsonify({
+            'success': False,
+            'error': f'impressions must be an integer from 0 to {MAX_REPORTED_IMPRESSIONS}'
+        }), 400
     
-    return redirect(post.affiliate_url)
+    if impressions:
+        click_buffer.record_impressions(post_id, impressions)
+    return jsonify({'success': True, 'post_id': post_id, 'impressions': impressions})
 
 # Enhanced API Endpoints for New Features
 
@@ -586,13 +682,14 @@ def setup_webhooks():
 @app.route('/products/refresh')
 @require_login
 def refresh_products():
-    """Refresh trending products from Amazon"""
+    """Refresh trending products and category best sellers from Amazon"""
     from inventory_manager import InventoryManager
     
     inventory = InventoryManager()
     count = inventory.refresh_trending_products()
+    best_sellers = inventory.refresh_category_products()
     
-    flash(f'Refreshed {count} trending products!', 'success')
+    flash(f'Refreshed {count} trending products and {best_sellers} best sellers!', 'success')
     return redirect(url_for('dashboard'))
 
 @app.route('/api/auto-promote', methods=['POST'])
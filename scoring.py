@@ -0,0 +1,109 @@
+"""
+AI Product Scoring - One scoring formula, in Python and as a SQL expression
+The stored ProductInventory.ai_score is kept current by computing the same
+formula in whichever layer changes an input
+"""
+from sqlalchemy import and_, case, func, literal, update
+
+# Columns the score depends on; changing any of them means re-scoring
+SCORE_INPUTS = ('rating', 'price', 'price_cents', 'times_promoted', 'conversion_rate', 'is_trending', 'category')
+
+CATEGORY_BONUS = {
+    'Electronics': 15,  # Electronics tend to convert well
+    'Gaming': 10,
+    'Smart Home': 10,
+}
+
+
+def calculate_ai_score(product):
+    """AI scoring algorithm considering multiple factors"""
+    score = 0
+
+    # Rating factor (0-50 points)
+    if product.rating:
+        score += (product.rating / 5.0) * 50
+
+    # Price range factor (prefer $20-$300 range)
+    if product.price:
+        if product.price_cents is None:
+            score += 10  # Default if the price couldn't be parsed at ingest
+        elif 2000 <= product.price_cents <= 30000:
+            score += 30  # Sweet spot for conversions
+        elif product.price_cents < 2000:
+            score += 15  # Too cheap, lower commissions
+        else:
+            score += 20  # Expensive, good commissions but harder to sell
+
+    # Promotion frequency (avoid over-promoted products)
+    times_promoted = product.times_promoted or 0
+    if times_promoted < 5:
+        score += 25  # Fresh products get bonus
+    elif times_promoted < 15:
+        score += 15  # Moderately promoted
+    else:
+        score += 5   # Over-promoted products get penalty
+
+    # Conversion rate factor
+    if product.conversion_rate:
+        score += product.conversion_rate * 20
+
+    # Trending bonus
+    if product.is_trending:
+        score += 20
+
+    # Category preferences
+    score += CATEGORY_BONUS.get(product.category, 0)
+
+    return score
+
+
+def ai_score_sql(**overrides):
+    """The scoring formula as a SQL expression over product_inventory
+
+    Pass a column name with an expression to score a value other than the
+    row's current one, e.g. the new times_promoted inside the UPDATE that
+    changes it (SET expressions otherwise see the old row).
+    """
+    from models import ProductInventory
+    
+    table = ProductInventory.__table__
+    col = {name: overrides.get(name, table.c[name]) for name in SCORE_INPUTS}
+
+    rating = case((col['rating'].isnot(None), col['rating'] / 5.0 * 50), else_=literal(0.0))
+    price = case(
+        (func.coalesce(col['price'], '') == '', literal(0)),
+        (col['price_cents'].is_(None), literal(10)),
+        (col['price_cents'].between(2000, 30000), literal(30)),
+        (col['price_cents'] < 2000, literal(15)),
+        else_=literal(20)
+    )
+    times_promoted = func.coalesce(col['times_promoted'], 0)
+    promotion = case(
+        (times_promoted < 5, literal(25)),
+        (times_promoted < 15, literal(15)),
+        else_=literal(5)
+    )
+    conversion = func.coalesce(col['conversion_rate'], 0.0) * 20
+    trending = case((func.coalesce(col['is_trending'], False) == True, literal(20)), else_=literal(0))
+    category = case(
+        *[(col['category'] == name, literal(bonus)) for name, bonus in CATEGORY_BONUS.items()],
+        else_=literal(0)
+    )
+    return rating + price + promotion + conversion + trending + category
+
+
+def refresh_ai_scores(*criteria, commit=False):
+    """Re-score matching rows in one UPDATE, skipping rows already correct"""
+    from app import db
+    from models import ProductInventory
+    
+    score = ai_score_sql()
+    result = db.session.execute(
+        update(ProductInventory)
+        .where(and_(*criteria, ProductInventory.ai_score.is_distinct_from(score)))
+        .values(ai_score=score)
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        db.session.commit()
+    return result.rowcount